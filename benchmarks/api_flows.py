@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark api flows against a local mock server
+
+Measures `tickets()`, the full receipt download, the coupon activation and the browserless
+login with configurable latency, page size and error rate and writes a json report, which
+can be compared to the report of another version.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+# pylint: disable=wrong-import-position
+from mock_server import MockLidlPlus, MockServer  # noqa: E402
+from lidlplus import LidlPlusApi  # noqa: E402
+from lidlplus.auth_cache import AuthCache  # noqa: E402
+from lidlplus.metrics import RequestEvent  # noqa: E402
+from lidlplus.ratelimit import RateLimiter  # noqa: E402
+
+
+def _tickets(api, args):
+    return len(api.tickets(max_workers=args.concurrency))
+
+
+def _receipts(api, args):
+    ids = [ticket["id"] for ticket in api.tickets(max_workers=args.concurrency)]
+    results = api.tickets_bulk(ids, max_workers=args.concurrency)
+    return sum(not isinstance(result, Exception) for result in results.values())
+
+
+def _coupons(api, args):
+    report = api.activate_all_coupons(max_workers=args.concurrency)
+    return sum(coupon["status"] == "activated" for coupon in report)
+
+
+def _login(api, _):
+    # the mock only exchanges the code it redirected to the callback with, so a returned token proves the login
+    code = MockLidlPlus.VERIFICATION_CODE
+    api.login(MockLidlPlus.PHONE, MockLidlPlus.PASSWORD, browserless=True, verify_token_func=lambda: code)
+    return int(bool(api.token))
+
+
+FLOWS = {"tickets": _tickets, "receipts": _receipts, "coupons": _coupons, "login": _login}
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0.0
+
+
+def run_flow(server, flow, args):
+    """Run a flow repeatedly with fresh connectors and collect its statistics"""
+    api_class = server.api_class(LidlPlusApi)
+    durations, latencies, items, requests, errors = [], [], 0, 0, 0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for _ in range(args.repeat):
+            server.mock.reset()
+            events = []
+            with api_class(
+                "de",
+                "DE",
+                "" if flow == "login" else "refresh",
+                hooks=[events.append],
+                backoff_factor=0.01,
+                rate_limiter=RateLimiter(args.rate, args.rate) if args.rate else None,
+                auth_cache=AuthCache(Path(cache_dir) / "auth.json"),
+            ) as api:
+                start = time.perf_counter()
+                try:
+                    items = FLOWS[flow](api, args)
+                except Exception as exc:  # pylint: disable=broad-except
+                    print(f"{flow} failed - {exc}", file=sys.stderr)
+                    errors += 1
+                durations.append(time.perf_counter() - start)
+            latencies += [
+                event.latency for event in events if isinstance(event, RequestEvent) and event.endpoint != "token"
+            ]
+            requests = sum(count for name, count in server.mock.requests.items() if name != "token")
+    median = statistics.median(durations)
+    return {
+        "median_s": round(median, 4),
+        "min_s": round(min(durations), 4),
+        "max_s": round(max(durations), 4),
+        "items": items,
+        "items_per_s": round(items / median, 1) if median else None,
+        "requests": requests,
+        "request_p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "request_p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+        "failed_runs": errors,
+    }
+
+
+def _version():
+    try:
+        command = ["git", "describe", "--always", "--dirty"]
+        return subprocess.run(command, cwd=ROOT, capture_output=True, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report, baseline):
+    """Print the change of the median durations against a baseline report"""
+    print(f"compared to {baseline['version']}:")
+    for flow, result in report["results"].items():
+        if not (old := baseline["results"].get(flow)):
+            continue
+        change = (result["median_s"] - old["median_s"]) / old["median_s"] * 100 if old["median_s"] else 0
+        print(
+            f"  {flow:<10}{old['median_s'] * 1000:>9.1f} ms -> {result['median_s'] * 1000:>9.1f} ms"
+            f" ({change:+.1f} %), requests {old['requests']} -> {result['requests']}"
+        )
+
+
+def main():
+    """Run benchmarks and print or write the report"""
+    parser = argparse.ArgumentParser(description="Benchmark api flows against a local mock server")
+    parser.add_argument("-f", "--flow", action="append", choices=list(FLOWS), help="flow to run (default: all)")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="runs per flow (default: 5)")
+    parser.add_argument("--tickets", type=int, default=200, help="number of tickets (default: 200)")
+    parser.add_argument("--page-size", type=int, default=25, help="tickets per page (default: 25)")
+    parser.add_argument("--max-page-size", type=int, default=100, help="largest accepted page size (default: 100)")
+    parser.add_argument("--coupons", type=int, default=40, help="coupons per coupon api (default: 40)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per response (default: 0.02)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing requests (default: 0)")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel requests (default: 8)")
+    parser.add_argument("--rate", type=float, help="client rate limit per second (default: library default)")
+    parser.add_argument("--out", metavar="PATH", help="write json report to this file")
+    parser.add_argument("--compare", metavar="PATH", help="json report of another version to compare with")
+    args = parser.parse_args()
+    config = {
+        key: getattr(args, key) for key in ("tickets", "page_size", "max_page_size", "coupons", "latency", "error_rate")
+    }
+    config.update(concurrency=args.concurrency, rate=args.rate, repeat=args.repeat)
+    mock = MockLidlPlus(
+        args.tickets,
+        args.page_size,
+        coupons=args.coupons,
+        max_page_size=args.max_page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+    report = {"version": _version(), "python": platform.python_version(), "config": config, "results": {}}
+    with MockServer(mock) as server:
+        for flow in args.flow or FLOWS:
+            report["results"][flow] = run_flow(server, flow, args)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
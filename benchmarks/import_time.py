@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark cli startup for commands authenticated by refresh token
+
+Runs `lidl-plus -r TOKEN id` up to argument parsing in fresh interpreters and fails
+if any module of the browser login stack got imported on the way.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+AUTH_MODULES = ["oic", "seleniumwire", "selenium", "webdriver_manager", "getuseragent", "aiohttp"]
+STARTUP = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "sys.argv = ['lidl-plus', '-l', 'de', '-c', 'DE', '-r', 'TOKEN', 'id']\n"
+    "import lidlplus.__main__ as cli\n"
+    "cli.get_arguments()\n"
+    "duration = time.perf_counter() - start\n"
+    "auth = [name for name in {modules} if name in sys.modules]\n"
+    "print(__import__('json').dumps({{'duration': duration, 'auth_modules': auth}}))\n"
+)
+
+
+def run_once():
+    """Measure one cold start in a new interpreter"""
+    code = STARTUP.format(modules=AUTH_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, check=True, text=True)
+    return json.loads(output.stdout)
+
+
+def slowest_imports(count=10):
+    """Get the modules with the highest cumulative import time"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lidlplus.__main__"],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    imports = []
+    for line in output.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    """Print startup statistics"""
+    parser = argparse.ArgumentParser(description="Benchmark lidl-plus cli startup")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="number of cold starts (default: 10)")
+    args = parser.parse_args()
+    results = [run_once() for _ in range(args.runs)]
+    durations = [result["duration"] * 1000 for result in results]
+    print(f"startup median {statistics.median(durations):.1f} ms, min {min(durations):.1f} ms ({args.runs} runs)")
+    print("slowest imports (cumulative):")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    if auth := sorted({name for result in results for name in result["auth_modules"]}):
+        print(f"auth modules imported on startup: {', '.join(auth)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
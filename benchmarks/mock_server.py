@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Local mock of the Lidl Plus api
+
+Serves the token, tickets, coupons (V1 and V2) and profile endpoints on one port with
+configurable latency, page size and error rate, so api flows can be measured offline.
+A stub of the account login forms (welcome, email, password, 2fa, legal terms) redirects
+to the app callback with an authorization code, which the token endpoint exchanges.
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+ROUTES = [
+    ("GET", r"/\.well-known/openid-configuration", "discovery"),
+    ("GET", r"/connect/authorize", "authorize"),
+    ("GET", r"/Account/Login", "login_page"),
+    ("POST", r"/Account/Login", "login_form"),
+    ("GET", r"/connect/authorize/callback", "callback"),
+    ("POST", r"/connect/token", "token"),
+    ("GET", r"/api/v2/(?P<country>\w+)/tickets", "tickets"),
+    ("GET", r"/api/v2/(?P<country>\w+)/tickets/(?P<id>[^/]+)", "ticket"),
+    ("GET", r"/api/v2/(?P<country>\w+)", "coupons"),
+    ("POST", r"/api/v1/(?P<country>\w+)/(?P<id>[^/]+)/activation", "activate_coupon"),
+    ("DELETE", r"/api/v1/(?P<country>\w+)/(?P<id>[^/]+)/activation", "deactivate_coupon"),
+    ("GET", r"/app/api/v1/promotionslist", "coupons_v1"),
+    ("POST", r"/app/api/v1/promotions/(?P<id>[^/]+)/activation", "activate_coupon_v1"),
+    ("GET", r"/profile/api/v1/(?P<country>\w+)/loyalty", "loyalty_id"),
+]
+LOGIN_PAGES = {"authorize", "login_page", "login_form", "callback"}
+
+_PAGE = (
+    '<!DOCTYPE html><html><body><div class="page {page}"><form method="post" action="/Account/Login">'
+    '<input type="hidden" name="__RequestVerificationToken" value="{token}">{content}'
+    '<span class="input-error-message">{error}</span>{buttons}</form></div></body></html>'
+)
+_BUTTON = '<div class="{context}"><button type="submit" name="{name}" value="{value}">Continue</button></div>'
+# content and buttons (context, name, value) of every login form, a step only continues with one of its buttons
+_FORMS = {
+    "welcome": ("", [("", "Step", "login")]),
+    "email": ('<input type="text" name="EmailOrPhone" value="">', [("", "Step", "email")]),
+    "password": (
+        '<input type="hidden" name="EmailOrPhone" value="{phone}"><input type="password" name="Password" value="">',
+        [("", "Step", "password")],
+    ),
+    "method": ("<p>Where should we send the code?</p>", [("phone", "Method", "sms"), ("email", "Method", "mail")]),
+    "code": ('<input type="text" name="VerificationCode" value="">', [("", "Step", "verify")]),
+    "terms": (
+        '<h2>Updated terms of use</h2><input type="checkbox" name="Accepted" value="true">',
+        [("", "Step", "terms")],
+    ),
+}
+
+
+# pylint: disable=too-many-instance-attributes
+class MockLidlPlus:
+    """
+    Mock api state and configuration.
+
+    :param tickets: Number of tickets of the account.
+    :param page_size: Tickets per page of the ticket list if the client doesn't ask for a page size.
+    :param max_page_size: Largest page size accepted by the pageSize parameter, 0 rejects the parameter.
+    :param items: Line items per receipt.
+    :param coupons: Number of coupons of each coupon api.
+    :param latency: Seconds every response is delayed.
+    :param error_rate: Fraction of api requests failing with 503 or 429, the login forms don't fail.
+    :param legal_terms: Ask to accept updated legal terms after the 2fa step of a login.
+    """
+
+    PHONE = "+4915112345678"
+    PASSWORD = "secret"
+    VERIFICATION_CODE = "123456"
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        tickets=200,
+        page_size=25,
+        items=12,
+        coupons=40,
+        *,
+        max_page_size=100,
+        latency=0.0,
+        error_rate=0.0,
+        legal_terms=False,
+        seed=0,
+    ):
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.legal_terms = legal_terms
+        self.issuer = ""
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._tickets = [self._receipt(i, start - timedelta(days=i), items) for i in range(tickets)]
+        self._by_id = {ticket["id"]: ticket for ticket in self._tickets}
+        self._coupons = [f"c{i}" for i in range(coupons)]
+        self._promotions = [f"p{i}" for i in range(coupons)]
+        self.activated = set()
+        self._logins = {}
+        self._codes = {}
+
+    @staticmethod
+    def _receipt(number, date, items):
+        lines = [
+            {
+                "name": f"Article {i}",
+                "codeInput": f"{4000000 + i}",
+                "isWeight": False,
+                "quantity": "1",
+                "currentUnitPrice": f"{1 + i % 5},{i % 100:02d}",
+                "originalAmount": f"{1 + i % 5},{i % 100:02d}",
+                "discounts": [{"description": "Coupon", "amount": "0,10"}] if i % 4 == 0 else [],
+            }
+            for i in range(items)
+        ]
+        return {
+            "id": f"T{number:08d}",
+            "date": date.isoformat(),
+            "totalAmount": f"{items * 3},00",
+            "store": {"id": "S1", "name": "Mock Store"},
+            "itemsLine": lines,
+        }
+
+    def reset(self):
+        """Deactivate all coupons and clear the request counter"""
+        with self._lock:
+            self.activated.clear()
+            self.requests.clear()
+
+    def fail(self, name):
+        """Count request to endpoint and get a random error status or None"""
+        with self._lock:
+            self.requests[name] += 1
+            if name == "token" or name in LOGIN_PAGES or self._random.random() >= self.error_rate:
+                return None
+            return self._random.choice([429, 503])
+
+    def handle(self, name, params, query):
+        """Get status and json body of an endpoint"""
+        # pylint: disable=too-many-return-statements
+        if name == "discovery":
+            return 200, self._discovery()
+        if name == "token":
+            if query.get("grant_type") == ["authorization_code"] and not self._redeem(query):
+                return 400, {"error": "invalid_grant"}
+            return 200, {"access_token": "token", "refresh_token": "refresh", "expires_in": 3600}
+        if name == "tickets":
+            page, size = int(query.get("pageNumber", ["1"])[0]), self.page_size
+            if "pageSize" in query:
+                if not self.max_page_size:
+                    return 400, {"error": "unknown parameter pageSize"}
+                size = min(int(query["pageSize"][0]), self.max_page_size)
+            tickets = self._tickets[(page - 1) * size : page * size]
+            summaries = [{key: ticket[key] for key in ("id", "date", "totalAmount", "store")} for ticket in tickets]
+            return 200, {"tickets": summaries, "page": page, "size": size, "totalCount": len(self._tickets)}
+        if name == "ticket":
+            ticket = self._by_id.get(params["id"])
+            return (200, ticket) if ticket else (404, {"error": "not found"})
+        if name == "coupons":
+            coupons = [self._coupon(coupon_id) for coupon_id in self._coupons]
+            return 200, {"sections": [{"name": "Mock", "coupons": coupons}]}
+        if name == "coupons_v1":
+            promotions = [self._promotion(promotion_id) for promotion_id in self._promotions]
+            return 200, {"sections": [{"promotions": promotions}]}
+        if name in ("activate_coupon", "activate_coupon_v1"):
+            with self._lock:
+                self.activated.add(params["id"])
+            return 200, {}
+        if name == "deactivate_coupon":
+            with self._lock:
+                self.activated.discard(params["id"])
+            return 200, {}
+        return 200, "1234567890123"
+
+    def _discovery(self):
+        return {
+            "issuer": self.issuer,
+            "authorization_endpoint": f"{self.issuer}/connect/authorize",
+            "token_endpoint": f"{self.issuer}/connect/token",
+            "jwks_uri": f"{self.issuer}/.well-known/openid-configuration/jwks",
+            "response_types_supported": ["code"],
+            "subject_types_supported": ["public"],
+            "id_token_signing_alg_values_supported": ["RS256"],
+            "code_challenge_methods_supported": ["S256"],
+        }
+
+    def _redeem(self, query):
+        """Check an authorization code was issued for the redirect uri and matches the PKCE verifier"""
+        with self._lock:
+            issued = self._codes.pop(query.get("code", [""])[0], None)
+        if not issued:
+            return False
+        digest = hashlib.sha256(query.get("code_verifier", [""])[0].encode()).digest()
+        challenge = base64.urlsafe_b64encode(digest).decode().rstrip("=")
+        return issued == (challenge, query.get("redirect_uri", [""])[0])
+
+    def login(self, name, query, session_id):
+        """Get status, html body and headers of a page of the login forms"""
+        if name == "authorize":
+            session_id = secrets.token_hex(8)
+            with self._lock:
+                self._logins[session_id] = {
+                    "redirect_uri": query.get("redirect_uri", [""])[0],
+                    "state": query.get("state", [""])[0],
+                    "challenge": query.get("code_challenge", [""])[0],
+                }
+            location = f"/Account/Login?ReturnUrl={quote('/connect/authorize/callback', safe='')}"
+            return 302, "", {"Location": location, "Set-Cookie": f"idsrv={session_id}; Path=/; HttpOnly"}
+        if not (session := self._logins.get(session_id)):
+            return 400, "<p>No login session</p>", {}
+        if name == "login_page":
+            return self._login_form(session, "welcome")
+        if name == "callback":
+            if not session.get("user"):
+                return 302, "", {"Location": "/Account/Login"}
+            code = secrets.token_hex(16).upper()
+            with self._lock:
+                self._codes[code] = (session["challenge"], session["redirect_uri"])
+            args = urlencode({"code": code, "scope": "openid", "state": session["state"]})
+            return 302, "", {"Location": f"{session['redirect_uri']}?{args}"}
+        return self._login_step(session, {key: values[0] for key, values in query.items()})
+
+    def _login_form(self, session, page, error=""):
+        content, buttons = _FORMS[page]
+        session.update(page=page, token=secrets.token_hex(8), buttons=[button[1:] for button in buttons])
+        body = _PAGE.format(
+            page=page,
+            token=session["token"],
+            content=content.format(phone=html.escape(self.PHONE)),
+            error=html.escape(error),
+            buttons="".join(_BUTTON.format(context=c, name=n, value=v) for c, n, v in buttons),
+        )
+        return 200, body, {}
+
+    # pylint: disable=too-many-return-statements
+    def _login_step(self, session, form):
+        """Check the submitted form of the current page and answer with the next page"""
+        page = session.get("page")
+        if form.get("__RequestVerificationToken") != session.get("token"):
+            return 400, "<p>Invalid request verification token</p>", {}
+        if not (clicked := [value for name, value in session["buttons"] if form.get(name) == value]):
+            return self._login_form(session, page, "Please use one of the buttons")
+        if page == "welcome":
+            return self._login_form(session, "email")
+        if page == "email":
+            if form.get("EmailOrPhone") != self.PHONE:
+                return self._login_form(session, page, "Unknown email or phone number")
+            return self._login_form(session, "password")
+        if page == "password":
+            if form.get("Password") != self.PASSWORD:
+                return self._login_form(session, page, "Wrong password")
+            return self._login_form(session, "method")
+        if page == "method":
+            session["method"] = clicked[0]
+            return self._login_form(session, "code")
+        if page == "code":
+            if form.get("VerificationCode") != self.VERIFICATION_CODE:
+                return self._login_form(session, page, "Invalid verification code")
+            if self.legal_terms:
+                return self._login_form(session, "terms")
+        elif page == "terms" and form.get("Accepted") != "true":
+            return self._login_form(session, page, "Please accept the terms of use")
+        session["user"] = self.PHONE
+        return 302, "", {"Location": "/connect/authorize/callback"}
+
+    def _coupon(self, coupon_id):
+        return {
+            "id": coupon_id,
+            "title": f"Coupon {coupon_id}",
+            "isActivated": coupon_id in self.activated,
+            "startValidityDate": "2020-01-01T00:00:00Z",
+            "endValidityDate": "2099-01-01T00:00:00Z",
+        }
+
+    def _promotion(self, promotion_id):
+        return {
+            "promotionId": promotion_id,
+            "title": f"Promotion {promotion_id}",
+            "isActivated": promotion_id in self.activated,
+            "validity": {"start": "2020-01-01T00:00:00Z", "end": "2099-01-01T00:00:00Z"},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _route(self):
+        url = urlsplit(self.path)
+        path = re.sub("/+", "/", url.path)
+        for method, pattern, name in ROUTES:
+            if method == self.command and (match := re.fullmatch(pattern, path)):
+                return name, match.groupdict(), parse_qs(url.query)
+        return None, {}, {}
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode()) if length else {}
+        name, params, query = self._route()
+        query.update(form)
+        time.sleep(self.mock.latency)
+        headers = {}
+        if name is None:
+            status, body = 404, {"error": "unknown endpoint"}
+        elif status := self.mock.fail(name):
+            body, headers = {"error": "mock failure"}, {"Retry-After": "0"} if status == 429 else {}
+        elif name in LOGIN_PAGES:
+            session = SimpleCookie(self.headers.get("Cookie", "")).get("idsrv")
+            status, body, headers = self.mock.login(name, query, session.value if session else "")
+        else:
+            status, body = self.mock.handle(name, params, query)
+        is_page = name in LOGIN_PAGES
+        payload = body.encode() if is_page else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8" if is_page else "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_DELETE = _respond
+
+
+class MockServer:
+    """Run a `MockLidlPlus` on a local port in a background thread"""
+
+    def __init__(self, mock=None, port=0):
+        self.mock = mock or MockLidlPlus()
+        handler = type("Handler", (_Handler,), {"mock": self.mock})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.mock.issuer = self.url
+
+    @property
+    def url(self):
+        """Base url of the server"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def api_class(self, base):
+        """Subclass of an api connector class sending all requests to this server"""
+        return type(
+            f"Mock{base.__name__}",
+            (base,),
+            {
+                "_AUTH_API": self.url,
+                "_TICKET_API": f"{self.url}/api/v2",
+                "_COUPONS_API": f"{self.url}/api",
+                "_COUPONS_V1_API": f"{self.url}/app/api/",
+                "_PROFILE_API": f"{self.url}/profile/api",
+            },
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    """Serve the mock until interrupted"""
+    parser = argparse.ArgumentParser(description="Local mock of the Lidl Plus api")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    parser.add_argument("--tickets", type=int, default=200, help="number of tickets (default: 200)")
+    parser.add_argument("--page-size", type=int, default=25, help="tickets per page (default: 25)")
+    parser.add_argument("--max-page-size", type=int, default=100, help="largest accepted page size (default: 100)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to delay every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing requests")
+    parser.add_argument("--legal-terms", action="store_true", help="ask to accept legal terms on login")
+    args = parser.parse_args()
+    mock = MockLidlPlus(
+        args.tickets,
+        args.page_size,
+        max_page_size=args.max_page_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        legal_terms=args.legal_terms,
+    )
+    with MockServer(mock, args.port) as server:
+        print(
+            f"Mock Lidl Plus api on {server.url}, login with {mock.PHONE} / {mock.PASSWORD} / {mock.VERIFICATION_CODE}"
+        )
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,14 @@ Lidl Plus api
 """
 
 from .api import LidlPlusApi
+from .session import create_session
+
+
+def __getattr__(name):
+    # the asyncio connector pulls in aiohttp, so it is only imported when used
+    if name in ("AsyncLidlPlusApi", "create_async_session"):
+        # pylint: disable=import-outside-toplevel
+        from . import aio
+
+        return getattr(aio, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,21 +3,32 @@
 lidl plus command line tool
 """
 import argparse
+import importlib.util
 import json
 import os
 import sys
 from getpass import getpass
 from pathlib import Path
-from datetime import datetime, timezone
 
 if __name__ == "__main__":
     sys.path.insert(0, str(Path(__file__).parent.parent))
 # pylint: disable=wrong-import-position
 from lidlplus import LidlPlusApi
+from lidlplus.archive import ReceiptArchive
 from lidlplus.exceptions import WebBrowserException, LoginError, LegalTermsException
+from lidlplus.export import FORMATS, export
+from lidlplus.fleet import LidlPlusFleet
+from lidlplus.http_cache import DiskCacheBackend, ResponseCache
+from lidlplus.metrics import Timings
+from lidlplus.server import Gateway, create_server
+from lidlplus.stats import load_receipts, spending_stats
+from lidlplus.store import ReceiptStore
+from lidlplus.token_store import FileTokenStore
+from lidlplus.utils import parse_date
+from lidlplus.watch import Watcher, ndjson_emitter, webhook_emitter
 
 
-def get_arguments():
+def get_arguments():  # pylint: disable=too-many-statements
     """Get parsed arguments."""
     parser = argparse.ArgumentParser(
         prog="lidl-plus",
@@ -35,6 +46,9 @@ def get_arguments():
         help="choose two factor auth method",
     )
     parser.add_argument("-r", "--refresh-token", metavar="TOKEN", help="refresh token to authenticate")
+    parser.add_argument("--browserless", help="login without web browser", action="store_true")
+    parser.add_argument("--token-file", metavar="PATH", help="persist tokens between runs in this file")
+    parser.add_argument("--http-cache", metavar="PATH", help="cache coupon and profile responses in this file")
     parser.add_argument("--skip-verify", help="skip ssl verification", action="store_true")
     parser.add_argument(
         "--not-accept-legal-terms",
@@ -42,6 +56,8 @@ def get_arguments():
         action="store_true",
     )
     parser.add_argument("-d", "--debug", help="debug mode", action="store_true")
+    parser.add_argument("--concurrency", metavar="N", type=int, default=4, help="parallel requests (default: 4)")
+    parser.add_argument("--timings", help="print latency breakdown of requests and login steps", action="store_true")
     subparser = parser.add_subparsers(title="commands", metavar="command", required=True)
     auth = subparser.add_parser("auth", help="authenticate and get token")
     auth.add_argument("auth", help="authenticate and print refresh_token", action="store_true")
@@ -50,21 +66,52 @@ def get_arguments():
     receipt = subparser.add_parser("receipt", help="output last receipts as json")
     receipt.add_argument("receipt", help="output last receipts as json", action="store_true")
     receipt.add_argument("-a", "--all", help="fetch all receipts", action="store_true")
+    receipt.add_argument("--store", metavar="PATH", help="sync receipts into local store and read from it")
+    receipt.add_argument("--stream", help="output receipts as NDJSON while downloading", action="store_true")
+    receipt.add_argument("--export", choices=FORMATS, help="export line items of the receipts")
+    receipt.add_argument("--out", metavar="PATH", help="export file (default: stdout)")
     coupon = subparser.add_parser("coupon", help="activate coupons")
     coupon.add_argument("coupon", help="output all coupons", action="store_true")
     coupon.add_argument("-a", "--all", help="activate all coupons", action="store_true")
+    coupon.add_argument("--dry-run", help="only show which coupons would be activated", action="store_true")
+    fleet = subparser.add_parser("fleet", help="run a command for many accounts")
+    fleet.add_argument("fleet", metavar="ACCOUNTS", help="json file with list of accounts")
+    fleet.add_argument("action", choices=["id", "receipt", "coupon"], help="command to run for each account")
+    fleet.add_argument("-a", "--all", help="fetch all receipts or activate all coupons", action="store_true")
+    fleet.add_argument("--dry-run", help="only show which coupons would be activated", action="store_true")
+    stats = subparser.add_parser("stats", help="show spending statistics of stored receipts")
+    stats.add_argument("stats", metavar="PATH", help="receipt store, archive, json or ndjson file of receipts")
+    stats.add_argument("--top", metavar="N", type=int, help="only show the N articles with the highest spending")
+    watch = subparser.add_parser("watch", help="output new receipts and coupons as NDJSON while running")
+    watch.add_argument("watch", help="watch for new receipts and coupons", action="store_true")
+    watch.add_argument("--interval", metavar="SEC", type=float, default=60, help="poll interval (default: 60)")
+    watch.add_argument(
+        "--max-interval", metavar="SEC", type=float, default=1800, help="poll interval without news (default: 1800)"
+    )
+    watch.add_argument("--only", choices=["receipts", "coupons"], help="only watch receipts or coupons")
+    watch.add_argument("--webhook", metavar="URL", help="post events to this url instead of printing them")
+    serve = subparser.add_parser("serve", help="serve receipts and coupons as local json api")
+    serve.add_argument("serve", help="serve receipts and coupons as local json api", action="store_true")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    serve.add_argument(
+        "--ttl", metavar="SEC", type=float, default=60, help="cache ticket lists and coupons (default: 60)"
+    )
+    serve.add_argument("--accounts", metavar="PATH", help="json file with list of accounts like for fleet")
+    archive = subparser.add_parser("archive", help="import receipts into or export them from a compressed archive")
+    archive.add_argument("archive", metavar="PATH", help="receipt archive file")
+    archive.add_argument("action", choices=["import", "export"], help="import files or export receipts as NDJSON")
+    archive.add_argument("files", metavar="FILE", nargs="*", help="receipt store, json or ndjson files to import")
+    archive.add_argument("--since", metavar="DATE", help="only export receipts issued at or after this date")
+    archive.add_argument("--until", metavar="DATE", help="only export receipts issued at or before this date")
+    archive.add_argument("--out", metavar="PATH", help="export file (default: stdout)")
     return vars(parser.parse_args())
 
 
-def check_auth():
-    """check auth package is installed"""
-    try:
-        # pylint: disable=import-outside-toplevel, unused-import
-        import oic
-        import seleniumwire
-        import getuseragent
-        import webdriver_manager
-    except ImportError:
+def check_auth(browserless=False):
+    """check auth package is installed without importing it"""
+    packages = ["oic"] if browserless else ["oic", "seleniumwire", "getuseragent", "webdriver_manager"]
+    if not all(importlib.util.find_spec(package) for package in packages):
         print(
             "To login and receive a refresh token you need to install all auth requirements:\n"
             '  pip install "lidl-plus[auth]"\n'
@@ -76,17 +123,23 @@ def check_auth():
 def lidl_plus_login(args):
     """handle authentication"""
     if not args.get("refresh_token"):
-        check_auth()
+        check_auth(browserless=args.get("browserless"))
     if args.get("skip_verify"):
         os.environ["WDM_SSL_VERIFY"] = "0"
         os.environ["CURL_CA_BUNDLE"] = ""
     language = args.get("language") or input("Enter your language (de, en, ...): ")
     country = args.get("country") or input("Enter your country (DE, AT, ...): ")
+    token_store = FileTokenStore(args["token_file"]) if args.get("token_file") else None
+    kwargs = {"token_store": token_store, "pool_maxsize": max(10, args.get("concurrency") or 0)}
+    if args.get("http_cache"):
+        kwargs["cache"] = ResponseCache(DiskCacheBackend(args["http_cache"]))
+    if args.get("timings"):
+        kwargs["hooks"] = [args["timings"]]
     if args.get("refresh_token"):
-        return LidlPlusApi(language, country, args.get("refresh_token"))
+        return LidlPlusApi(language, country, args.get("refresh_token"), **kwargs)
     username = args.get("user") or input("Enter your lidl plus username (phone number): ")
     password = args.get("password") or getpass("Enter your lidl plus password: ")
-    lidl_plus = LidlPlusApi(language, country)
+    lidl_plus = LidlPlusApi(language, country, **kwargs)
     try:
         text = f"Enter the verify code you received via {args['2fa']}: "
         lidl_plus.login(
@@ -96,6 +149,7 @@ def lidl_plus_login(args):
             verify_mode=args["2fa"],
             headless=not args.get("debug"),
             accept_legal_terms=not args.get("not_accept_legal_terms"),
+            browserless=args.get("browserless"),
         )
     except WebBrowserException:
         print("Can't connect to web browser. Please install Chrome, Chromium or Firefox")
@@ -122,55 +176,182 @@ def print_loyalty_id(args):
     print(lidl_plus.loyalty_id())
 
 
+def export_tickets(lidl_plus, args):
+    """export line items of receipts"""
+    if args["export"] == "parquet" and not args.get("out"):
+        print("Parquet export needs an output file (--out PATH)", file=sys.stderr)
+        sys.exit(2)
+    if args.get("store"):
+        with ReceiptStore(args["store"]) as store:
+            lidl_plus.sync(store, max_workers=args.get("concurrency"))
+            receipts = store.receipts(lidl_plus.country)
+        receipts = receipts if args.get("all") else receipts[:1]
+    elif args.get("all"):
+        receipts = lidl_plus.iter_receipts(max_workers=args.get("concurrency"))
+    else:
+        receipts = [lidl_plus.ticket(next(lidl_plus.iter_tickets(prefetch=False))["id"])]
+    if args["export"] == "parquet":
+        export(receipts, "parquet", args["out"])
+    elif args.get("out"):
+        with open(args["out"], "w", newline="", encoding="utf-8") as file:
+            export(receipts, args["export"], file)
+    else:
+        export(receipts, args["export"], sys.stdout)
+
+
 def print_tickets(args):
     """pretty print as json"""
     lidl_plus = lidl_plus_login(args)
+    if args.get("export"):
+        export_tickets(lidl_plus, args)
+        return
+    if args.get("stream"):
+        if args.get("all"):
+            for ticket in lidl_plus.iter_receipts(max_workers=args.get("concurrency")):
+                print(json.dumps(ticket), flush=True)
+        else:
+            print(json.dumps(lidl_plus.ticket(next(lidl_plus.iter_tickets(prefetch=False))["id"])))
+        return
+    if args.get("store"):
+        with ReceiptStore(args["store"]) as store:
+            lidl_plus.sync(store, max_workers=args.get("concurrency"))
+            tickets = store.receipts(lidl_plus.country)
+        print(json.dumps(tickets if args.get("all") else tickets[0], indent=4))
+        return
     if args.get("all"):
-        tickets = [lidl_plus.ticket(ticket["id"]) for ticket in lidl_plus.tickets()]
+        concurrency = args.get("concurrency")
+        ids = [ticket["id"] for ticket in lidl_plus.tickets(max_workers=concurrency)]
+        tickets = []
+        for ticket_id, ticket in lidl_plus.tickets_bulk(ids, max_workers=concurrency).items():
+            if isinstance(ticket, Exception):
+                print(f"Failed to fetch receipt {ticket_id} - {ticket}", file=sys.stderr)
+                continue
+            tickets.append(ticket)
     else:
-        tickets = lidl_plus.ticket(lidl_plus.tickets()[0]["id"])
+        tickets = lidl_plus.ticket(next(lidl_plus.iter_tickets(prefetch=False))["id"])
     print(json.dumps(tickets, indent=4))
 
 
 def activate_coupons(args):
     """Activate all available coupons"""
     lidl_plus = lidl_plus_login(args)
-    coupons = lidl_plus.coupons()
     if not args.get("all"):
-        print(json.dumps(coupons, indent=4))
+        print(json.dumps(lidl_plus.coupons(), indent=4))
         return
-    i = 0
-    for section in coupons.get("sections", {}):
-        for coupon in section.get("coupons", {}):
-            if coupon["isActivated"]:
-                continue
-            if datetime.fromisoformat(coupon["startValidityDate"]) > datetime.now(timezone.utc):
-                continue
-            if datetime.fromisoformat(coupon["endValidityDate"]) < datetime.now(timezone.utc):
-                continue
-            print("activating coupon: ", coupon["title"])
-            lidl_plus.activate_coupon(coupon["id"])
-            i += 1
-    # Some coupons are only available through V1 API
-    coupons = lidl_plus.coupon_promotions_v1()
-    for section in coupons.get("sections", {}):
-        for coupon in section.get("promotions", {}):
-            if coupon["isActivated"]:
-                continue
-            validity = coupon.get("validity", {})
-            if datetime.fromisoformat(validity["start"]) > datetime.now(timezone.utc):
-                continue
-            if datetime.fromisoformat(validity["end"]) < datetime.now(timezone.utc):
-                continue
-            print("activating coupon v1: ", coupon["title"])
-            lidl_plus.activate_coupon_promotion_v1(coupon["promotionId"])
-            i += 1
-    print(f"Activated {i} coupons")
+    report = lidl_plus.activate_all_coupons(max_workers=args.get("concurrency"), dry_run=args.get("dry_run"))
+    for coupon in report:
+        version = " v1" if coupon["api"] == "v1" else ""
+        if coupon["status"] == "failed":
+            print(f"failed to activate coupon{version}: ", coupon["title"], "-", coupon["error"], file=sys.stderr)
+        elif coupon["status"] == "planned":
+            print(f"would activate coupon{version}: ", coupon["title"])
+        else:
+            print(f"activating coupon{version}: ", coupon["title"])
+    if args.get("dry_run"):
+        print(f"Would activate {len(report)} coupons")
+    else:
+        print(f"Activated {sum(coupon['status'] == 'activated' for coupon in report)} coupons")
+
+
+def run_fleet(args):
+    """Run command for all accounts of a file"""
+    with open(args["fleet"], encoding="utf-8") as file:
+        accounts = json.load(file)
+    concurrency = args.get("concurrency")
+    hooks = [args["timings"]] if args.get("timings") else None
+    with LidlPlusFleet(accounts, max_workers=concurrency * 4, per_host=concurrency * 2, hooks=hooks) as fleet:
+        if args["action"] == "id":
+            results = fleet.loyalty_ids()
+        elif args["action"] == "receipt":
+            results = fleet.receipts(latest_only=not args.get("all"))
+        elif args.get("all"):
+            results = fleet.activate_coupons(dry_run=args.get("dry_run"))
+        else:
+            results = fleet.map(LidlPlusApi.coupons)
+    print(json.dumps(results, indent=4, default=lambda error: {"error": str(error)}))
+
+
+def print_stats(args):
+    """Aggregate spending of local receipts"""
+    receipts = load_receipts(args["stats"], country=args.get("country"))
+    print(json.dumps(spending_stats(receipts, top=args.get("top")), indent=4, ensure_ascii=False))
+
+
+def run_watch(args):
+    """Emit new receipts and coupons until interrupted"""
+    lidl_plus = lidl_plus_login(args)
+    emit = webhook_emitter(args["webhook"]) if args.get("webhook") else ndjson_emitter()
+    watcher = Watcher(
+        lidl_plus,
+        emit,
+        interval=args["interval"],
+        max_interval=args["max_interval"],
+        receipts=args.get("only") != "coupons",
+        coupons=args.get("only") != "receipts",
+    )
+    try:
+        watcher.run()
+    finally:
+        lidl_plus.close()
+
+
+def run_server(args):
+    """Serve the api of one or many accounts until interrupted"""
+    if args.get("accounts"):
+        with open(args["accounts"], encoding="utf-8") as file:
+            accounts = json.load(file)
+        concurrency = args.get("concurrency")
+        owner = LidlPlusFleet(accounts, max_workers=concurrency * 4, per_host=concurrency * 2)
+        apis = owner.accounts
+    else:
+        owner = lidl_plus_login(args)
+        apis = {"default": owner}
+    gateway = Gateway(apis, ttl=args["ttl"], max_workers=args.get("concurrency"))
+    server = create_server(gateway, args["host"], args["port"])
+    print(f"Serving {', '.join(apis)} on http://{args['host']}:{args['port']}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        owner.close()
+
+
+def run_archive(args):
+    """Import receipts into or export them from a compressed archive"""
+    with ReceiptArchive(args["archive"], "a" if args["action"] == "import" else "r") as archive:
+        if args["action"] == "import":
+            for path in args["files"]:
+                added = archive.extend(load_receipts(path, country=args.get("country")))
+                print(f"Imported {len(added)} new receipts from {path}", file=sys.stderr)
+            return
+        since, until = (parse_date(args[key]) if args.get(key) else None for key in ("since", "until"))
+        if args.get("out"):
+            with open(args["out"], "w", encoding="utf-8") as file:
+                write_ndjson(archive.receipts(since, until), file)
+        else:
+            write_ndjson(archive.receipts(since, until), sys.stdout)
+
+
+def write_ndjson(receipts, file):
+    """Write every receipt as json line"""
+    for receipt in receipts:
+        file.write(json.dumps(receipt, ensure_ascii=False) + "\n")
 
 
 def main():
     """argument commands"""
     args = get_arguments()
+    if args.get("timings"):
+        args["timings"] = Timings()
+    try:
+        run_command(args)
+    finally:
+        if args.get("timings"):
+            print(args["timings"].report(), file=sys.stderr)
+
+
+def run_command(args):
+    """run selected command"""
     if args.get("auth"):
         print_refresh_token(args)
     elif args.get("id"):
@@ -179,6 +360,16 @@ def main():
         print_tickets(args)
     elif args.get("coupon"):
         activate_coupons(args)
+    elif args.get("fleet"):
+        run_fleet(args)
+    elif args.get("stats"):
+        print_stats(args)
+    elif args.get("watch"):
+        run_watch(args)
+    elif args.get("serve"):
+        run_server(args)
+    elif args.get("archive"):
+        run_archive(args)
 
 
 def start():
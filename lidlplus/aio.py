@@ -0,0 +1,273 @@
+"""
+Lidl Plus asyncio api
+"""
+
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+from lidlplus.api import LidlPlusApi
+from lidlplus.exceptions import ApiError, MissingLogin
+from lidlplus.ratelimit import RETRY_STATUS, RateLimiter, backoff, retry_after
+from lidlplus.utils import api_headers, date_range, in_date_range, page_count, page_passed
+
+try:
+    import aiohttp
+except ImportError:
+    pass
+
+
+def create_async_session(limit=100, limit_per_host=10):
+    """
+    Create an aiohttp session with connection pooling.
+
+    The session can be shared by many `AsyncLidlPlusApi` instances, e.g. one per account.
+
+    :param limit: Maximum number of open connections.
+    :param limit_per_host: Maximum number of open connections per host.
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    return aiohttp.ClientSession(connector=connector)
+
+
+# pylint: disable=too-many-instance-attributes
+class AsyncLidlPlusApi:
+    """Lidl Plus asyncio api connector, authenticated by refresh token"""
+
+    # same endpoints and settings as the sync client, overriding them there applies to both
+    # pylint: disable=protected-access
+    _CLIENT_ID = LidlPlusApi._CLIENT_ID
+    _AUTH_API = LidlPlusApi._AUTH_API
+    _TICKET_API = LidlPlusApi._TICKET_API
+    _COUPONS_API = LidlPlusApi._COUPONS_API
+    _COUPONS_V1_API = LidlPlusApi._COUPONS_V1_API
+    _PROFILE_API = LidlPlusApi._PROFILE_API
+    _OS = LidlPlusApi._OS
+    _TIMEOUT = LidlPlusApi._TIMEOUT
+    _PAGE_SIZE = LidlPlusApi._PAGE_SIZE
+    # pylint: enable=protected-access
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, language, country, refresh_token, session=None, *, retries=3, backoff_factor=0.5, rate_limiter=None
+    ):
+        """
+        Create Lidl Plus asyncio api connector.
+
+        :param session: An aiohttp session to share between connectors.
+            If not set, a pooled session is created on first use and owned by this instance.
+        :param retries: How often rate limited and failed requests are retried.
+        :param backoff_factor: Factor for the exponential backoff with jitter between retries.
+        :param rate_limiter: A `lidlplus.ratelimit.RateLimiter` to share between connectors.
+        """
+        self._owns_session = session is None
+        self._session = session
+        self._refresh_token = refresh_token
+        self._expires = None
+        self._token = ""
+        self._token_lock = None
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._page_size = self._PAGE_SIZE
+        self._country = country.upper()
+        self._language = language.lower()
+
+    @property
+    def refresh_token(self):
+        """Lidl Plus api refresh token"""
+        return self._refresh_token
+
+    @property
+    def token(self):
+        """Current token to query api"""
+        return self._token
+
+    async def close(self):
+        """Close the http session if it was created by this instance"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _send(self, method, url, **kwargs):
+        if (delay := self._rate_limiter.reserve(url)) > 0:
+            await asyncio.sleep(delay)
+        async with self._session.request(method, url, **kwargs) as response:
+            await response.read()
+            return response
+
+    async def _request(self, method, url, retry_status=RETRY_STATUS, **kwargs):
+        """Send request with rate limiting, retries with backoff and one token renewal like `LidlPlusApi`"""
+        if self._session is None:
+            self._session = create_async_session()
+        kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=self._TIMEOUT))
+        renewed, attempt = False, 0
+        while True:
+            response = await self._send(method, url, **kwargs)
+            headers = kwargs.get("headers") or {}
+            if response.status == 401 and not renewed and headers.get("Authorization", "").startswith("Bearer "):
+                kwargs["headers"] = {**headers, "Authorization": f"Bearer {await self._renewed_token(headers)}"}
+                renewed = True
+                continue
+            delay = retry_after(response.headers)
+            if response.status == 429:
+                self._rate_limiter.slow_down(url, delay)
+            elif response.status < 400:
+                self._rate_limiter.speed_up(url)
+            if response.status not in retry_status or attempt >= self._retries:
+                break
+            await asyncio.sleep(delay if delay is not None else backoff(attempt, self._backoff_factor))
+            attempt += 1
+        if response.status >= 400:
+            raise ApiError.from_response(response, retry_after=retry_after(response.headers))
+        return response
+
+    async def _renewed_token(self, headers):
+        """Renew the token rejected in headers, unless another request already did"""
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if headers["Authorization"] == f"Bearer {self._token}":
+                await self._renew_token()
+        return self._token
+
+    async def _auth(self, payload):
+        default_secret = base64.b64encode(f"{self._CLIENT_ID}:secret".encode()).decode()
+        headers = {
+            "Authorization": f"Basic {default_secret}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        # a gateway error may come after the refresh token was rotated, only rejected requests are resent
+        url = f"{self._AUTH_API}/connect/token"
+        response = await self._request("POST", url, retry_status=(429,), headers=headers, data=payload)
+        response = await response.json(content_type=None)
+        self._expires = datetime.utcnow() + timedelta(seconds=response["expires_in"])
+        self._token = response["access_token"]
+        self._refresh_token = response["refresh_token"]
+
+    async def _renew_token(self):
+        payload = {"refresh_token": self._refresh_token, "grant_type": "refresh_token"}
+        return await self._auth(payload)
+
+    def _token_expired(self):
+        if not self._token:
+            return bool(self._refresh_token)
+        return datetime.utcnow() >= self._expires
+
+    async def _default_headers(self):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        if self._token_expired():
+            async with self._token_lock:
+                if self._token_expired():
+                    await self._renew_token()
+        if not self._token:
+            raise MissingLogin("You need to login!")
+        return api_headers(self._token, self._language, self._OS)
+
+    async def _get_json(self, url, headers):
+        response = await self._request("GET", url, headers=headers)
+        return await response.json(content_type=None)
+
+    async def _tickets_page(self, page, only_favorite=False, headers=None):
+        url = f"{self._TICKET_API}/{self._country}/tickets?pageNumber={page}&onlyFavorite={only_favorite}"
+        if self._page_size:
+            url = f"{url}&pageSize={self._page_size}"
+        return await self._get_json(url, headers or await self._default_headers())
+
+    async def _first_tickets_page(self, only_favorite, headers):
+        try:
+            return await self._tickets_page(1, only_favorite, headers)
+        except ApiError as exc:
+            if exc.status != 400 or not self._page_size:
+                raise
+            self._page_size = None
+            return await self._tickets_page(1, only_favorite, headers)
+
+    async def tickets(self, only_favorite=False, since=None, until=None, max_workers=None):
+        """
+        Get a list of all tickets, pages after the first one are fetched concurrently.
+
+        :param only_favorite: Only retrieve favorite tickets.
+        :type only_favorite: bool
+        :param since: Only get tickets from this date on, pages are then fetched in batches of max_workers
+            and no older pages are requested.
+        :type since: datetime
+        :param until: Only get tickets up to this date.
+        :type until: datetime
+        :param max_workers: Maximum number of pages fetched at once, defaults to all or 4 with since.
+        :type max_workers: int
+        """
+        since, until = date_range(since, until)
+        headers = await self._default_headers()
+        page = await self._first_tickets_page(only_favorite, headers)
+        pages, tickets = list(range(2, page_count(page) + 1)), page["tickets"]
+        batch = max_workers or (4 if since else len(pages) or 1)
+        for start in range(0, len(pages) if not page_passed(page, since) else 0, batch):
+            numbers = pages[start : start + batch]
+            results = await asyncio.gather(*(self._tickets_page(i, only_favorite, headers) for i in numbers))
+            tickets += [item for result in results for item in result["tickets"]]
+            if any(page_passed(result, since) for result in results):
+                break
+        return [item for item in tickets if in_date_range(item, since, until)]
+
+    async def ticket(self, ticket_id):
+        """Get full data of single ticket by id"""
+        url = f"{self._TICKET_API}/{self._country}/tickets"
+        return await self._get_json(f"{url}/{ticket_id}", await self._default_headers())
+
+    async def tickets_bulk(self, ticket_ids, max_workers=8):
+        """
+        Get full data of many tickets concurrently.
+
+        :param ticket_ids: Ids of the tickets to fetch.
+        :param max_workers: Maximum number of parallel requests.
+        :return: Dict of ticket id to ticket data or raised exception, in order of `ticket_ids`.
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(ticket_id):
+            async with semaphore:
+                return await self.ticket(ticket_id)
+
+        results = await asyncio.gather(*(fetch(ticket_id) for ticket_id in ticket_ids), return_exceptions=True)
+        return dict(zip(ticket_ids, results))
+
+    async def coupon_promotions_v1(self):
+        """Get list of all coupons API V1"""
+        url = f"{self._COUPONS_V1_API}/v1/promotionslist"
+        return await self._get_json(url, {**await self._default_headers(), "Country": self._country})
+
+    async def activate_coupon_promotion_v1(self, promotion_id):
+        """Activate single coupon by id API V1"""
+        url = f"{self._COUPONS_V1_API}/v1/promotions/{promotion_id}/activation"
+        headers = {**await self._default_headers(), "Country": self._country}
+        return await self._request("POST", url, headers=headers)
+
+    async def coupons(self):
+        """Get list of all coupons"""
+        url = f"{self._COUPONS_API}/v2/{self._country}"
+        return await self._get_json(url, await self._default_headers())
+
+    async def activate_coupon(self, coupon_id):
+        """Activate single coupon by id"""
+        url = f"{self._COUPONS_API}/v1/{self._country}/{coupon_id}/activation"
+        response = await self._request("POST", url, headers=await self._default_headers())
+        return await response.json(content_type=None)
+
+    async def deactivate_coupon(self, coupon_id):
+        """Deactivate single coupon by id"""
+        url = f"{self._COUPONS_API}/v1/{self._country}/{coupon_id}/activation"
+        response = await self._request("DELETE", url, headers=await self._default_headers())
+        return await response.json(content_type=None)
+
+    async def loyalty_id(self):
+        """Get your loyalty ID"""
+        url = f"{self._PROFILE_API}/v1/{self._country}/loyalty"
+        response = await self._request("GET", url, headers=await self._default_headers())
+        return await response.text()
@@ -3,37 +3,35 @@ Lidl Plus api
 """
 
 import base64
-import html
+import hashlib
 import logging
-import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from urllib.parse import urlsplit
 
 import requests
+from urllib3.exceptions import MaxRetryError
 
-from lidlplus.exceptions import (
-    WebBrowserException,
-    LoginError,
-    LegalTermsException,
-    MissingLogin,
-)
-
-try:
-    from getuseragent import UserAgent
-    from oic.oic import Client
-    from oic.utils.authn.client import CLIENT_AUTHN_METHOD
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support import expected_conditions
-    from selenium.webdriver.support.ui import WebDriverWait
-    from seleniumwire import webdriver
-    from seleniumwire.utils import decode
-    from webdriver_manager.chrome import ChromeDriverManager
-    from webdriver_manager.firefox import GeckoDriverManager
-    from webdriver_manager.core.os_manager import ChromeType
-except ImportError:
-    pass
+from lidlplus.exceptions import ApiError, MissingLogin
+from lidlplus.auth_cache import DEFAULT_CACHE
+from lidlplus.coupons import coupon_plan
+from lidlplus.http_cache import ResponseCache
+from lidlplus.http_login import HttpLogin
+from lidlplus.metrics import PhaseEvent, RequestEvent
+from lidlplus.models import Receipt
+from lidlplus.ratelimit import RETRY_STATUS, RateLimiter, backoff, retry_after
+from lidlplus.session import create_session
+from lidlplus.utils import api_headers, date_range, in_date_range, page_count, page_passed, parse_date
 
+_LOGGER = logging.getLogger(__name__)
 
+
+# pylint: disable=too-many-instance-attributes, too-many-public-methods
 class LidlPlusApi:
     """Lidl Plus api connector"""
 
@@ -46,15 +44,71 @@ class LidlPlusApi:
     _APP = "com.lidlplus.app"
     _OS = "iOs"
     _TIMEOUT = 10
-
-    def __init__(self, language, country, refresh_token=""):
+    _DISCOVERY_TTL = 24 * 60 * 60
+    _LOYALTY_ID_TTL = 30 * 24 * 60 * 60
+    _PAGE_SIZE = 100
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        language,
+        country,
+        refresh_token="",
+        *,
+        session=None,
+        token_store=None,
+        refresh_margin=60,
+        auth_cache=None,
+        cache=None,
+        retries=3,
+        backoff_factor=0.5,
+        rate_limiter=None,
+        hooks=None,
+        **session_kwargs,
+    ):
+        """
+        Create Lidl Plus api connector.
+
+        :param session: A requests compatible session to reuse, e.g. with a custom transport adapter.
+            If not set, a pooled keep-alive session is created and owned by this instance.
+        :param token_store: A `lidlplus.token_store.TokenStore` to persist tokens across processes.
+        :param refresh_margin: Seconds before expiry the token is renewed in background.
+        :param auth_cache: A `lidlplus.auth_cache.AuthCache` for discovery and web driver lookups,
+            defaults to a cache file shared by all instances.
+        :param cache: A `lidlplus.http_cache.ResponseCache` for coupon and profile responses,
+            defaults to an in-memory cache, `False` disables caching.
+        :param retries: How often rate limited, failed and timed out requests are retried.
+        :param backoff_factor: Factor for the exponential backoff with jitter between retries.
+        :param rate_limiter: A `lidlplus.ratelimit.RateLimiter` to share between connectors,
+            defaults to an adaptive limit of 50 requests per second and host.
+        :param hooks: Callables receiving a `lidlplus.metrics.RequestEvent` per request and a
+            `lidlplus.metrics.PhaseEvent` per login step, e.g. `lidlplus.metrics.MetricsRegistry`.
+        :param session_kwargs: Options for `create_session` like pool_maxsize or retries.
+        """
+        self._auth_cache = auth_cache or DEFAULT_CACHE
+        self._cache = ResponseCache() if cache is None else cache or None
+        self._owns_session = session is None
+        self._session = session
+        if session is None:
+            self._session = create_session(retries=retries, backoff_factor=backoff_factor, **session_kwargs)
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._hooks = list(hooks or [])
+        self._page_size = self._PAGE_SIZE
+        self._last_pagination = {}
         self._login_url = ""
         self._code_verifier = ""
         self._refresh_token = refresh_token
         self._expires = None
         self._token = ""
+        self._token_lock = threading.Lock()
+        self._token_store = token_store
+        self._origin_refresh_token = refresh_token
+        self._refresh_margin = refresh_margin
         self._country = country.upper()
         self._language = language.lower()
+        self._load_token()
 
     @property
     def refresh_token(self):
@@ -66,11 +120,142 @@ class LidlPlusApi:
         """Current token to query api"""
         return self._token
 
+    @property
+    def country(self):
+        """Country of the account"""
+        return self._country
+
+    @property
+    def session(self):
+        """Http session shared by all requests"""
+        return self._session
+
+    def close(self):
+        """Close the http session if it was created by this instance"""
+        if self._owns_session:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_hook(self, hook):
+        """Add callable receiving the request and phase events"""
+        self._hooks.append(hook)
+
+    def _emit(self, event):
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning("Instrumentation hook failed - %s", exc)
+
+    @contextmanager
+    def _phase(self, name):
+        """Time a step and pass it to the hooks as `PhaseEvent`"""
+        start, error = time.perf_counter(), None
+        try:
+            yield
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if self._hooks:
+                self._emit(PhaseEvent(name, time.perf_counter() - start, error))
+
+    def _request(self, method, url, *, endpoint=None, retry_status=RETRY_STATUS, **kwargs):
+        """
+        Send request through the rate limiter.
+
+        Responses with a retry_status are retried with backoff, honoring Retry-After, and a rejected
+        token is renewed once. Error responses left after that raise the matching `ApiError`.
+        Every request is reported to the hooks as `RequestEvent`, with retries included.
+        """
+        kwargs.setdefault("timeout", self._TIMEOUT)
+        start, response, error, sends, renewed = time.perf_counter(), None, None, 0, False
+        try:
+            while True:
+                self._rate_limiter.wait(url)
+                response, sends = self._session.request(method, url, **kwargs), sends + 1
+                if response.status_code == 401 and not renewed and self._bearer(kwargs.get("headers")):
+                    kwargs["headers"] = {**kwargs["headers"], **self._renewed_headers(kwargs["headers"])}
+                    renewed = True
+                    continue
+                delay = retry_after(response.headers)
+                if response.status_code == 429:
+                    self._rate_limiter.slow_down(url, delay)
+                elif response.status_code < 400:
+                    self._rate_limiter.speed_up(url)
+                if response.status_code not in retry_status or sends - renewed > self._retries:
+                    break
+                delay = delay if delay is not None else backoff(sends - renewed - 1, self._backoff_factor)
+                _LOGGER.debug("Retry %s %s in %.1fs after status %s", method, url, delay, response.status_code)
+                time.sleep(delay)
+            if response.status_code >= 400:
+                raise ApiError.from_response(response, retry_after=retry_after(response.headers))
+            return response
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if self._hooks:
+                self._emit(
+                    RequestEvent(
+                        endpoint or urlsplit(url).path,
+                        method,
+                        url,
+                        getattr(response, "status_code", None),
+                        time.perf_counter() - start,
+                        len(response.content) if response is not None else 0,
+                        max(0, sends - 1),
+                        error,
+                    )
+                )
+
+    def _bearer(self, headers):
+        return bool(self._refresh_token) and (headers or {}).get("Authorization", "").startswith("Bearer ")
+
+    def _renewed_headers(self, headers):
+        """Renew the token rejected in headers, unless another request already did"""
+        with self._token_lock, self._shared_token():
+            if headers["Authorization"] == f"Bearer {self._token}":
+                self._renew_token()
+        return {"Authorization": f"Bearer {self._token}"}
+
+    def _cache_key(self, url):
+        identity = f"{self._origin_refresh_token}:{self._country}:{self._language}"
+        account = hashlib.sha256(identity.encode()).hexdigest()[:16]
+        return f"{account}:{url}"
+
+    def _cached_get(self, url, headers, ttl=None, endpoint=None):
+        if not self._cache:
+            return self._request("GET", url, endpoint=endpoint, headers=headers)
+        send = partial(self._request, "GET", url, endpoint=endpoint)
+        return self._cache.fetch(self._cache_key(url), url, lambda headers: send(headers=headers), headers, ttl)
+
+    def _invalidate_coupons(self):
+        if self._cache:
+            self._cache.invalidate(self._cache_key(f"{self._COUPONS_API}/v2/{self._country}"))
+            self._cache.invalidate(self._cache_key(f"{self._COUPONS_V1_API}/v1/promotionslist"))
+
     def _register_oauth_client(self):
         if self._login_url:
             return self._login_url
+        # pylint: disable=import-outside-toplevel
+        from oic.oic import Client
+        from oic.utils.authn.client import CLIENT_AUTHN_METHOD
+
         client = Client(client_authn_method=CLIENT_AUTHN_METHOD, client_id=self._CLIENT_ID)
-        client.provider_config(self._AUTH_API)
+        discovery_key = f"discovery:{self._AUTH_API}"
+        if not (discovery := self._auth_cache.get(discovery_key, ttl=self._DISCOVERY_TTL)):
+            discovery = self._request(
+                "GET", f"{self._AUTH_API}/.well-known/openid-configuration", endpoint="discovery"
+            ).json()
+            self._auth_cache.set(discovery_key, discovery)
+        provider_config = client.message_factory.get_response_type("configuration_endpoint")().from_dict(discovery)
+        client.handle_provider_config(provider_config, self._AUTH_API, keys=False)
         code_challenge, self._code_verifier = client.add_code_challenge()
         args = {
             "client_id": client.client_id,
@@ -83,62 +268,84 @@ class LidlPlusApi:
         self._login_url = auth_req.request(client.authorization_endpoint)
         return self._login_url
 
-    def _init_chrome(self, headless=True):
-        user_agent = UserAgent(self._OS.lower()).Random()
-        logging.getLogger("WDM").setLevel(logging.NOTSET)
-        options = webdriver.ChromeOptions()
-        if headless:
-            options.add_argument("headless")
-        options.add_experimental_option("mobileEmulation", {"userAgent": user_agent})
-        for chrome_type in [ChromeType.GOOGLE, ChromeType.MSEDGE, ChromeType.CHROMIUM]:
-            try:
-                service = Service(ChromeDriverManager(chrome_type=chrome_type).install())
-                return webdriver.Chrome(service=service, options=options)
-            except AttributeError:
-                continue
-        raise WebBrowserException("Unable to find a suitable Chrome driver")
-
-    def _init_firefox(self, headless=True):
-        user_agent = UserAgent(self._OS.lower()).Random()
-        logging.getLogger("WDM").setLevel(logging.NOTSET)
-        options = webdriver.FirefoxOptions()
-        if headless:
-            options.headless = True
-        profile = webdriver.FirefoxProfile()
-        profile.set_preference("general.useragent.override", user_agent)
-        return webdriver.Firefox(
-            executable_path=GeckoDriverManager().install(),
-            firefox_binary="/usr/bin/firefox",
-            options=options,
-            firefox_profile=profile,
-        )
-
-    def _get_browser(self, headless=True):
-        try:
-            return self._init_chrome(headless=headless)
-        # pylint: disable=broad-except
-        except Exception as exc1:
-            try:
-                return self._init_firefox(headless=headless)
-            except Exception as exc2:
-                raise WebBrowserException from exc1 and exc2
-
     def _auth(self, payload):
         default_secret = base64.b64encode(f"{self._CLIENT_ID}:secret".encode()).decode()
         headers = {
             "Authorization": f"Basic {default_secret}",
             "Content-Type": "application/x-www-form-urlencoded",
         }
-        kwargs = {"headers": headers, "data": payload, "timeout": self._TIMEOUT}
-        response = requests.post(f"{self._AUTH_API}/connect/token", **kwargs).json()
+        # a gateway error may come after the refresh token was rotated, only rejected requests are resent
+        response = self._request(
+            "POST",
+            f"{self._AUTH_API}/connect/token",
+            endpoint="token",
+            retry_status=(429,),
+            headers=headers,
+            data=payload,
+        )
+        response = response.json()
         self._expires = datetime.utcnow() + timedelta(seconds=response["expires_in"])
         self._token = response["access_token"]
         self._refresh_token = response["refresh_token"]
+        if not self._origin_refresh_token:
+            self._origin_refresh_token = self._refresh_token
+        self._save_token()
 
     def _renew_token(self):
         payload = {"refresh_token": self._refresh_token, "grant_type": "refresh_token"}
         return self._auth(payload)
 
+    def _load_token(self):
+        if not self._token_store or not (data := self._token_store.load()):
+            return
+        if self._origin_refresh_token and data.get("origin_refresh_token") != self._origin_refresh_token:
+            return
+        expires = datetime.fromisoformat(data["expires"])
+        if self._expires and expires <= self._expires:
+            return
+        self._token, self._expires, self._refresh_token = data["access_token"], expires, data["refresh_token"]
+        self._origin_refresh_token = self._origin_refresh_token or data.get("origin_refresh_token", "")
+
+    @contextmanager
+    def _shared_token(self):
+        """Hold the lock of the token store and pick up a token another process renewed meanwhile"""
+        with self._token_store.lock() if self._token_store else nullcontext():
+            self._load_token()
+            yield
+
+    def _save_token(self):
+        if not self._token_store:
+            return
+        data = {
+            "access_token": self._token,
+            "expires": self._expires.isoformat(),
+            "refresh_token": self._refresh_token,
+            "origin_refresh_token": self._origin_refresh_token,
+        }
+        self._token_store.save(data)
+
+    def _token_expired(self, margin=0):
+        if not self._token:
+            return bool(self._refresh_token)
+        return datetime.utcnow() + timedelta(seconds=margin) >= self._expires
+
+    def _renew_token_in_background(self):
+        # pylint: disable=consider-using-with
+        if not self._token_lock.acquire(blocking=False):
+            return
+
+        def renew():
+            try:
+                with self._shared_token():
+                    if self._token_expired(self._refresh_margin):
+                        self._renew_token()
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning("Background token renewal failed - %s", exc)
+            finally:
+                self._token_lock.release()
+
+        threading.Thread(target=renew, daemon=True).start()
+
     def _authorization_code(self, code):
         payload = {
             "grant_type": "authorization_code",
@@ -157,98 +364,105 @@ class LidlPlusApi:
         params = "&".join([f"{key}={value}" for key, value in args.items()])
         return f"{self._register_oauth_client()}&{params}"
 
-    @staticmethod
-    def _accept_legal_terms(browser, wait, accept=True):
-        wait.until(expected_conditions.visibility_of_element_located((By.ID, "checkbox_Accepted"))).click()
-        if not accept:
-            title = browser.find_element(By.TAG_NAME, "h2").text
-            raise LegalTermsException(title)
-        browser.find_element(By.TAG_NAME, "button").click()
-
-    def _parse_code(self, browser, wait, accept_legal_terms=True):
-        for request in reversed(browser.requests):
-            if f"{self._AUTH_API}/connect" not in request.url:
-                continue
-            location = request.response.headers.get("Location", "")
-            if "legalTerms" in location:
-                self._accept_legal_terms(browser, wait, accept=accept_legal_terms)
-                return self._parse_code(browser, wait, False)
-            if code := re.findall("code=([0-9A-F]+)", location):
-                return code[0]
-        return ""
-
-    def _click(self, browser, button, request=""):
-        del browser.requests
-        browser.backend.storage.clear_requests()
-        browser.find_element(*button).click()
-        self._check_input_error(browser)
-        if request and browser.wait_for_request(request, 10):
-            self._check_input_error(browser)
-
-    @staticmethod
-    def _check_input_error(browser):
-        if errors := browser.find_elements(By.CLASS_NAME, "input-error-message"):
-            for error in errors:
-                if error.text:
-                    raise LoginError(error.text)
-
-    def _check_login_error(self, browser):
-        response = browser.wait_for_request(f"{self._AUTH_API}/Account/Login.*", 10).response
-        body = html.unescape(decode(response.body, response.headers.get("Content-Encoding", "identity")).decode())
-        if error := re.findall('app-errors="\\{[^:]*?:.(.*?).}', body):
-            raise LoginError(error[0])
-
-    def _check_2fa_auth(self, browser, wait, verify_mode="phone", verify_token_func=None):
-        if verify_mode not in ["phone", "email"]:
-            raise ValueError(f'Unknown 2fa-mode "{verify_mode}" - Only "phone" or "email" supported')
-        response = browser.wait_for_request(f"{self._AUTH_API}/Account/Login.*", 10).response
-        if "/connect/authorize/callback" not in response.headers.get("Location"):
-            element = wait.until(expected_conditions.visibility_of_element_located((By.CLASS_NAME, verify_mode)))
-            element.find_element(By.TAG_NAME, "button").click()
-            verify_code = verify_token_func()
-            browser.find_element(By.NAME, "VerificationCode").send_keys(verify_code)
-            self._click(browser, (By.CLASS_NAME, "role_next"))
-
     def login(self, phone, password, **kwargs):
-        """Simulate app auth"""
-        browser = self._get_browser(headless=kwargs.get("headless", True))
-        browser.get(self._register_link)
-        wait = WebDriverWait(browser, 10)
-        wait.until(expected_conditions.visibility_of_element_located((By.ID, "button_welcome_login"))).click()
-        wait.until(expected_conditions.visibility_of_element_located((By.NAME, "EmailOrPhone"))).send_keys(phone)
-        self._click(browser, (By.ID, "button_btn_submit_email"))
-        self._click(
-            browser,
-            (By.ID, "button_btn_submit_email"),
-            request=f"{self._AUTH_API}/api/phone/exists.*",
-        )
-        wait.until(expected_conditions.element_to_be_clickable((By.ID, "field_Password"))).send_keys(password)
-        self._click(browser, (By.ID, "button_submit"))
-        self._check_login_error(browser)
-        self._check_2fa_auth(
-            browser,
-            wait,
-            kwargs.get("verify_mode", "phone"),
-            kwargs.get("verify_token_func"),
-        )
-        browser.wait_for_request(f"{self._AUTH_API}/connect.*")
-        code = self._parse_code(browser, wait, accept_legal_terms=kwargs.get("accept_legal_terms", True))
+        """
+        Simulate app auth
+
+        :param browserless: Drive the login forms with plain http requests instead of a web browser.
+        :param browser_pool: `BrowserPool` lending a running web browser, see `lidlplus.browser`.
+        """
+        if kwargs.get("browserless"):
+            login, phase = HttpLogin(f"{self._APP}://callback", timeout=self._TIMEOUT), "login.forms"
+        else:
+            with self._phase("login.import"):
+                # pylint: disable=import-outside-toplevel
+                from lidlplus.browser import BrowserLogin
+
+            login, phase = BrowserLogin(self._AUTH_API, self._OS, self._auth_cache, phase=self._phase), "login.browser"
+        with self._phase("login.register"):
+            login_url = self._register_link
+        with self._phase(phase):
+            code = login.login(login_url, phone, password, **kwargs)
         self._authorization_code(code)
 
     def _default_headers(self):
-        if (not self._token and self._refresh_token) or datetime.utcnow() >= self._expires:
-            self._renew_token()
+        if self._token_expired():
+            with self._token_lock, self._shared_token():
+                if self._token_expired():
+                    self._renew_token()
+        elif self._token_expired(self._refresh_margin):
+            self._renew_token_in_background()
         if not self._token:
             raise MissingLogin("You need to login!")
-        return {
-            "Authorization": f"Bearer {self._token}",
-            "App-Version": "999.99.9",
-            "Operating-System": self._OS,
-            "App": "com.lidl.eci.lidl.plus",
-            "Accept-Language": self._language,
-        }
+        return api_headers(self._token, self._language, self._OS)
+
+    def _tickets_page(self, page, only_favorite=False, headers=None):
+        url = f"{self._TICKET_API}/{self._country}/tickets?pageNumber={page}&onlyFavorite={only_favorite}"
+        if self._page_size:
+            url = f"{url}&pageSize={self._page_size}"
+        return self._request("GET", url, endpoint="tickets", headers=headers or self._default_headers()).json()
+
+    def _first_tickets_page(self, only_favorite, headers):
+        try:
+            return self._tickets_page(1, only_favorite, headers)
+        except ApiError as exc:
+            if exc.status != 400 or not self._page_size:
+                raise
+            _LOGGER.debug("Page size %s not accepted, using the default page size", self._page_size)
+            self._page_size = None
+            return self._tickets_page(1, only_favorite, headers)
+
+    def _ticket_pages(self, only_favorite=False, since=None, window=1, max_pages=None):
+        """
+        Yield the pages of the ticket list in order.
+
+        Up to window pages are downloaded ahead in parallel, with window 0 the next page is only requested
+        once the current one was processed. Stops after the first page reaching back beyond since or after
+        max_pages pages.
+        """
+        stats = {"pages": 0, "page_size": None, "requests": 1, "tickets": 0}
+        self._last_pagination = stats
+        headers, page_size = self._default_headers(), self._page_size
+        page = self._first_tickets_page(only_favorite, headers)
+        stats["requests"] += page_size != self._page_size
+        stats.update(pages=page_count(page), page_size=page.get("size"), tickets=len(page["tickets"]))
+        yield page
+        if page_passed(page, since):
+            return
+        numbers = iter(range(2, min(stats["pages"], max_pages or stats["pages"]) + 1))
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=max(1, window))
+
+        def fill(size):
+            if size <= 0:
+                return
+            for number in numbers:
+                pending.append(executor.submit(self._tickets_page, number, only_favorite, headers))
+                stats["requests"] += 1
+                if len(pending) >= size:
+                    return
+
+        try:
+            fill(max(1, window))
+            while pending:
+                page = pending.popleft().result()
+                stats["tickets"] += len(page["tickets"])
+                fill(window)
+                yield page
+                if page_passed(page, since):
+                    return
+                if not pending:
+                    fill(1)
+        finally:
+            stats["requests"] -= sum(future.cancel() for future in pending)
+            executor.shutdown(wait=False)
 
-    def tickets(self, only_favorite=False):
+    @property
+    def last_pagination(self):
+        """Pages, page size, requests and tickets of the last ticket listing"""
+        return dict(self._last_pagination)
+
+    def tickets(self, only_favorite=False, max_workers=1, since=None, until=None):
         """
         Get a list of all tickets.
 
@@ -256,55 +470,219 @@ class LidlPlusApi:
             If set to True, only favorite tickets will be returned.
             If set to False (the default), all tickets will be retrieved.
         :type onlyFavorite: bool
+        :param max_workers: Number of pages fetched in parallel once the first page is known.
+        :type max_workers: int
+        :param since: Only get tickets from this date on, no older pages are requested.
+        :type since: datetime
+        :param until: Only get tickets up to this date.
+        :type until: datetime
         """
-        url = f"{self._TICKET_API}/{self._country}/tickets"
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
-        ticket = requests.get(f"{url}?pageNumber=1&onlyFavorite={only_favorite}", **kwargs).json()
-        tickets = ticket["tickets"]
-        for i in range(2, int(ticket["totalCount"] / ticket["size"] + 2)):
-            tickets += requests.get(f"{url}?pageNumber={i}", **kwargs).json()["tickets"]
-        return tickets
+        since, until = date_range(since, until)
+        pages = self._ticket_pages(only_favorite, since, window=max_workers)
+        return [item for page in pages for item in page["tickets"] if in_date_range(item, since, until)]
+
+    def iter_tickets(self, only_favorite=False, since=None, prefetch=True, until=None, max_pages=None):
+        """
+        Iterate over all tickets, newest first, while the pages are downloaded.
+
+        :param only_favorite: Only retrieve favorite tickets.
+        :type only_favorite: bool
+        :param since: Stop at the first ticket older than this date, naive dates are treated as UTC.
+        :type since: datetime
+        :param prefetch: Download the next page in background while the current one is processed.
+        :type prefetch: bool
+        :param until: Skip tickets newer than this date.
+        :type until: datetime
+        :param max_pages: Stop after this many pages of the ticket list.
+        :type max_pages: int
+        """
+        since, until = date_range(since, until)
+        pages = self._ticket_pages(only_favorite, since, window=1 if prefetch else 0, max_pages=max_pages)
+        for page in pages:
+            for item in page["tickets"]:
+                if since and item.get("date") and parse_date(item["date"]) < since:
+                    return
+                if in_date_range(item, None, until):
+                    yield item
 
     def ticket(self, ticket_id):
         """Get full data of single ticket by id"""
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
         url = f"{self._TICKET_API}/{self._country}/tickets"
-        return requests.get(f"{url}/{ticket_id}", **kwargs).json()
+        return self._request("GET", f"{url}/{ticket_id}", endpoint="ticket", headers=self._default_headers()).json()
+
+    def receipt(self, ticket_id):
+        """
+        Get full data of single ticket by id as typed receipt.
+
+        :return: `lidlplus.models.Receipt`, decoded lazily from the response body.
+        """
+        url = f"{self._TICKET_API}/{self._country}/tickets"
+        response = self._request("GET", f"{url}/{ticket_id}", endpoint="ticket", headers=self._default_headers())
+        return Receipt(response.content)
+
+    def tickets_bulk(self, ticket_ids, max_workers=8):
+        """
+        Get full data of many tickets concurrently.
+
+        A failing ticket doesn't abort the others, its exception is returned in place of the data.
+        Rate limited requests are retried honoring the Retry-After header.
+
+        :param ticket_ids: Ids of the tickets to fetch.
+        :type ticket_ids: list
+        :param max_workers: Maximum number of parallel requests.
+        :type max_workers: int
+        :return: Dict of ticket id to ticket data or raised exception, in order of `ticket_ids`.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {ticket_id: executor.submit(self.ticket, ticket_id) for ticket_id in ticket_ids}
+        return {ticket_id: future.exception() or future.result() for ticket_id, future in futures.items()}
+
+    def iter_receipts(self, max_workers=8, only_favorite=False, since=None):
+        """
+        Iterate over full receipts, newest first, while they are downloaded.
+
+        A bounded window of receipts is fetched in parallel, receipts failing to download are logged and skipped.
+
+        :param max_workers: Maximum number of parallel receipt downloads.
+        :type max_workers: int
+        :param only_favorite: Only retrieve favorite tickets.
+        :type only_favorite: bool
+        :param since: Stop at the first ticket older than this date.
+        :type since: datetime
+        """
+        pending = deque()
+
+        def next_receipt():
+            ticket_id, future = pending.popleft()
+            try:
+                return future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning("Failed to fetch receipt %s - %s", ticket_id, exc)
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for ticket in self.iter_tickets(only_favorite=only_favorite, since=since):
+                pending.append((ticket["id"], executor.submit(self.ticket, ticket["id"])))
+                if len(pending) >= max_workers * 2 and (receipt := next_receipt()) is not None:
+                    yield receipt
+            while pending:
+                if (receipt := next_receipt()) is not None:
+                    yield receipt
+
+    def sync(self, store, max_workers=8):
+        """
+        Download new receipts into a local receipt store.
+
+        Tickets are walked newest first and the walk stops at the first already stored ticket, so only
+        new receipts are requested. Receipts which failed to download are retried on the next sync.
+
+        :param store: Receipt store to sync into.
+        :type store: lidlplus.store.ReceiptStore
+        :param max_workers: Maximum number of parallel receipt downloads.
+        :type max_workers: int
+        :return: List of ids of the newly stored receipts.
+        """
+        new = []
+        for ticket in self.iter_tickets(prefetch=False):
+            if store.contains(self._country, ticket["id"]):
+                break
+            new.append(ticket)
+        store.add_summaries(self._country, new)
+        stored = []
+        for ticket_id, receipt in self.tickets_bulk(store.missing(self._country), max_workers).items():
+            if isinstance(receipt, Exception):
+                _LOGGER.warning("Failed to fetch receipt %s - %s", ticket_id, receipt)
+                continue
+            store.add_receipt(self._country, ticket_id, receipt)
+            stored.append(ticket_id)
+        return stored
 
     def coupon_promotions_v1(self):
         """Get list of all coupons API V1"""
         url = f"{self._COUPONS_V1_API}/v1/promotionslist"
-        kwargs = {"headers": {**self._default_headers(), "Country": self._country}, "timeout": self._TIMEOUT}
-        return requests.get(url, **kwargs).json()
+        headers = {**self._default_headers(), "Country": self._country}
+        return self._cached_get(url, headers, endpoint="coupons_v1").json()
 
     def activate_coupon_promotion_v1(self, promotion_id):
         """Activate single coupon by id API V1"""
         url = f"{self._COUPONS_V1_API}/v1/promotions/{promotion_id}/activation"
-        kwargs = {"headers": {**self._default_headers(), "Country": self._country}, "timeout": self._TIMEOUT}
-        return requests.post(url, **kwargs)
+        headers = {**self._default_headers(), "Country": self._country}
+        response = self._request("POST", url, endpoint="activate_coupon_v1", headers=headers)
+        self._invalidate_coupons()
+        return response
 
     def coupons(self):
         """Get list of all coupons"""
         url = f"{self._COUPONS_API}/v2/{self._country}"
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
-        return requests.get(url, **kwargs).json()
+        return self._cached_get(url, self._default_headers(), endpoint="coupons").json()
 
     def activate_coupon(self, coupon_id):
         """Activate single coupon by id"""
         url = f"{self._COUPONS_API}/v1/{self._country}/{coupon_id}/activation"
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
-        return requests.post(url, **kwargs).json()
+        response = self._request("POST", url, endpoint="activate_coupon", headers=self._default_headers())
+        self._invalidate_coupons()
+        return response.json()
 
     def deactivate_coupon(self, coupon_id):
         """Deactivate single coupon by id"""
         url = f"{self._COUPONS_API}/v1/{self._country}/{coupon_id}/activation"
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
-        return requests.delete(url, **kwargs).json()
+        response = self._request("DELETE", url, endpoint="deactivate_coupon", headers=self._default_headers())
+        self._invalidate_coupons()
+        return response.json()
+
+    @staticmethod
+    def _response_lost(exc):
+        """Request was sent but its response got lost, the session only retries failed connections of a POST"""
+        if isinstance(exc, requests.exceptions.ReadTimeout):
+            return True
+        cause = exc.args[0] if exc.args else None
+        return isinstance(exc, requests.exceptions.ConnectionError) and not isinstance(cause, MaxRetryError)
+
+    def activate_planned_coupon(self, coupon, retries=2):
+        """
+        Activate a coupon of an `activate_all_coupons` dry run plan.
+
+        Error responses and failed connections are already retried per request. Activating is idempotent,
+        so only requests whose response got lost are retried here.
+
+        :return: The coupon dict with status activated or failed and error message.
+        """
+        attempt = 0
+        while True:
+            try:
+                if coupon["api"] == "v1":
+                    self.activate_coupon_promotion_v1(coupon["id"])
+                else:
+                    self.activate_coupon(coupon["id"])
+                return {**coupon, "status": "activated"}
+            except Exception as exc:  # pylint: disable=broad-except
+                if attempt == retries or not self._response_lost(exc):
+                    return {**coupon, "status": "failed", "error": str(exc)}
+                time.sleep(backoff(attempt, self._backoff_factor))
+                attempt += 1
+
+    def activate_all_coupons(self, max_workers=8, dry_run=False, retries=2):
+        """
+        Activate all currently valid coupons of the V2 and V1 API.
+
+        :param max_workers: Maximum number of parallel requests.
+        :type max_workers: int
+        :param dry_run: Only plan which coupons would be activated.
+        :type dry_run: bool
+        :param retries: How often an activation whose response got lost is retried.
+        :type retries: int
+        :return: List of dicts with id, title, api version and status (planned, activated or failed)
+            of each coupon, failed ones contain an error message.
+        """
+        with ThreadPoolExecutor(max_workers=max(2, max_workers)) as executor:
+            coupons = executor.submit(self.coupons)
+            promotions = executor.submit(self.coupon_promotions_v1)
+            plan = coupon_plan(coupons.result(), promotions.result())
+            if dry_run:
+                return [{**coupon, "status": "planned"} for coupon in plan]
+            return list(executor.map(lambda coupon: self.activate_planned_coupon(coupon, retries), plan))
 
     def loyalty_id(self):
         """Get your loyalty ID"""
         url = f"{self._PROFILE_API}/v1/{self._country}/loyalty"
-        kwargs = {"headers": self._default_headers(), "timeout": self._TIMEOUT}
-        response = requests.get(url, **kwargs)
-        response.raise_for_status()
-        return response.text
+        return self._cached_get(url, self._default_headers(), ttl=self._LOYALTY_ID_TTL, endpoint="loyalty_id").text
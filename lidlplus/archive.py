@@ -0,0 +1,310 @@
+"""
+Compressed receipt archive
+"""
+
+import importlib.util
+import json
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from lidlplus.utils import file_lock, parse_date
+
+MAGIC = b"LPRA\x01"
+_HEADER = struct.Struct(">cI")
+_RECORD = struct.Struct(">IH")
+_ZLIB_WINDOW = 32 * 1024
+_BASE_DICTIONARY = json.dumps(
+    {
+        "id": "",
+        "date": "",
+        "totalAmount": "",
+        "store": {"id": "", "name": ""},
+        "itemsLine": [
+            {
+                "name": "",
+                "codeInput": "",
+                "isWeight": False,
+                "quantity": "1",
+                "currentUnitPrice": "",
+                "originalAmount": "",
+                "discounts": [{"description": "", "amount": ""}],
+            }
+        ],
+    },
+    separators=(",", ":"),
+).encode()
+
+
+def _dumps(receipt):
+    return json.dumps(receipt, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _zstandard():
+    """Import zstandard of the archive extra, it's optional and only loaded for zstd archives"""
+    # pylint: disable=import-outside-toplevel, import-error
+    import zstandard
+
+    return zstandard
+
+
+def _dictionary(codec, samples):
+    """Build the shared dictionary of a new archive from the first receipts"""
+    content = (_BASE_DICTIONARY + b"".join(samples))[-_ZLIB_WINDOW:]
+    if codec == b"s" and len(samples) >= 8:
+        zstandard = _zstandard()
+        try:
+            return zstandard.train_dictionary(16 * 1024, samples).as_bytes()
+        except zstandard.ZstdError:
+            pass
+    return content
+
+
+class _Codec:
+    """Record compression with the shared dictionary of an archive"""
+
+    def __init__(self, codec, dictionary, level=None):
+        self._codec = codec
+        self._dictionary = dictionary
+        if codec == b"s":
+            zstandard = _zstandard()
+            data = zstandard.ZstdCompressionDict(dictionary)
+            self._compressor = zstandard.ZstdCompressor(level=level or 10, dict_data=data)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=data)
+        elif codec == b"z":
+            self._level = level or 9
+        else:
+            raise ValueError(f"Unknown archive codec {codec!r}")
+
+    def compress(self, data):
+        """Compress one record"""
+        if self._codec == b"s":
+            return self._compressor.compress(data)
+        compressor = zlib.compressobj(self._level, zlib.DEFLATED, -15, zdict=self._dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        """Decompress one record"""
+        if self._codec == b"s":
+            return self._decompressor.decompress(data)
+        return zlib.decompressobj(-15, zdict=self._dictionary).decompress(data)
+
+
+# pylint: disable=too-many-instance-attributes
+class ReceiptArchive:
+    """
+    Append-only file of compressed receipts.
+
+    Every receipt is compressed on its own with a dictionary shared by the whole archive, so one receipt is
+    read without decompressing the others. The file is memory mapped for reading. An index next to it maps
+    ticket ids and dates to record offsets and is rebuilt from the record headers if it's missing or behind.
+    Readers never modify the files, writers in other processes are serialized with a lock file next to it.
+    """
+
+    def __init__(self, path, mode="r", codec=None, level=None):
+        """
+        :param path: Archive file, the index is stored as `<path>.idx`.
+        :param mode: "r" to read an existing archive, "a" to also add receipts, creating the archive if missing.
+        :param codec: "zstd" or "zlib" for new archives, defaults to zstd if installed.
+        :param level: Compression level of new records.
+        """
+        if mode not in ("r", "a"):
+            raise ValueError(f'Unknown archive mode "{mode}" - Only "r" or "a" supported')
+        self._path = Path(path)
+        self._index_path = Path(f"{path}.idx")
+        self._lock_path = Path(f"{path}.lock")
+        self._writable = mode == "a"
+        if codec is None:
+            codec = "zstd" if importlib.util.find_spec("zstandard") else "zlib"
+        self._new_codec = {"zstd": b"s", "zlib": b"z"}[codec]
+        self._level = level
+        self._codec = None
+        self._entries = {}
+        self._file = None
+        self._map = None
+        self._end = 0
+        if not self._writable:
+            self._open()
+        elif self._path.exists() and self._path.stat().st_size:
+            with file_lock(self._lock_path):
+                self._open()
+
+    def _open(self):
+        self._file = open(self._path, "r+b" if self._writable else "rb")  # pylint: disable=consider-using-with
+        start = len(MAGIC) + _HEADER.size
+        header = self._file.read(start)
+        if not header.startswith(MAGIC) or len(header) < start:
+            self.close()
+            raise ValueError(f"{self._path} is no receipt archive")
+        codec, length = _HEADER.unpack(header[len(MAGIC) :])
+        self._codec = _Codec(codec, self._file.read(length), self._level)
+        self._end = start + length
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as file:
+                lines = [line.rstrip("\n").split("\t", 3) for line in file if line.endswith("\n")]
+        except FileNotFoundError:
+            lines = []
+        size = os.path.getsize(self._path)
+        for offset, length, date, ticket_id in lines:
+            offset, length = int(offset), int(length)
+            if offset + length > size:
+                break
+            self._entries[ticket_id] = (offset, length, date)
+            self._end = max(self._end, offset + length)
+        found = self._scan(size)
+        if self._writable and (len(self._entries) < len(lines) or found):
+            self._write_index()
+
+    def _scan(self, size):
+        """
+        Index records behind the indexed ones.
+
+        A partially written last record is ignored by readers and cut off by writers, which hold the lock,
+        so it can't belong to a writer still appending.
+        """
+        found = False
+        self._file.seek(self._end)
+        while self._end + _RECORD.size <= size:
+            payload, meta_length = _RECORD.unpack(self._file.read(_RECORD.size))
+            length = _RECORD.size + meta_length + payload
+            if self._end + length > size:
+                break
+            ticket_id, date = self._file.read(meta_length).decode().split("\t", 1)
+            self._entries[ticket_id] = (self._end, length, date)
+            self._end += length
+            self._file.seek(self._end)
+            found = True
+        if self._writable and self._end < size:
+            self._file.truncate(self._end)
+        return found
+
+    def _write_index(self):
+        lines = [f"{offset}\t{length}\t{date}\t{key}\n" for key, (offset, length, date) in self._entries.items()]
+        temp = self._index_path.with_name(f"{self._index_path.name}.{os.getpid()}.tmp")
+        temp.write_text("".join(lines), encoding="utf-8")
+        os.replace(temp, self._index_path)
+
+    def _create(self, samples):
+        dictionary = _dictionary(self._new_codec, samples)
+        self._codec = _Codec(self._new_codec, dictionary, self._level)
+        self._file = open(self._path, "w+b")  # pylint: disable=consider-using-with
+        self._file.write(MAGIC + _HEADER.pack(self._new_codec, len(dictionary)) + dictionary)
+        self._index_path.write_text("", encoding="utf-8")
+        self._end = self._file.tell()
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self):
+        """Close archive file"""
+        self._unmap()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._entries
+
+    def __iter__(self):
+        """Stream all receipts in the order they were added"""
+        for offset, length, _ in sorted(self._entries.values()):
+            yield self._read(offset, length)
+
+    def ids(self):
+        """Get ids of all archived receipts"""
+        return list(self._entries)
+
+    def extend(self, receipts):
+        """
+        Append receipts, already archived ticket ids are skipped.
+
+        :return: List of ids of the added receipts.
+        """
+        if not self._writable:
+            raise ValueError(f"{self._path} is opened read-only")
+        receipts = list(receipts)
+        with file_lock(self._lock_path):
+            if self._file is None and self._path.exists() and self._path.stat().st_size:
+                self._open()
+            elif self._file is not None and (size := os.path.getsize(self._path)) > self._end:
+                # records another process appended meanwhile
+                self._scan(size)
+                self._unmap()
+            return self._append(receipts)
+
+    def _append(self, receipts):
+        records = {}
+        for receipt in receipts:
+            if receipt["id"] not in self._entries:
+                records[receipt["id"]] = (receipt.get("date") or "", _dumps(receipt))
+        if not records:
+            return []
+        if self._file is None:
+            self._create([data for _, data in records.values()])
+        self._file.seek(self._end)
+        index = []
+        for ticket_id, (date, data) in records.items():
+            meta = f"{ticket_id}\t{date}".encode()
+            payload = self._codec.compress(data)
+            self._file.write(_RECORD.pack(len(payload), len(meta)) + meta + payload)
+            length = _RECORD.size + len(meta) + len(payload)
+            self._entries[ticket_id] = (self._end, length, date)
+            index.append(f"{self._end}\t{length}\t{date}\t{ticket_id}\n")
+            self._end += length
+        self._file.flush()
+        with open(self._index_path, "a", encoding="utf-8") as file:
+            file.write("".join(index))
+        self._unmap()
+        return list(records)
+
+    def append(self, receipt):
+        """Append one receipt, return False if it was already archived"""
+        return bool(self.extend([receipt]))
+
+    def _read(self, offset, length):
+        if self._map is None:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, meta_length = _RECORD.unpack_from(self._map, offset)
+        start = offset + _RECORD.size + meta_length
+        return json.loads(self._codec.decompress(self._map[start : offset + length]))
+
+    def get(self, ticket_id):
+        """Get receipt by ticket id or None"""
+        if (entry := self._entries.get(ticket_id)) is None:
+            return None
+        return self._read(entry[0], entry[1])
+
+    def receipts(self, since=None, until=None):
+        """
+        Iterate receipts newest first, only the ones in the date range are decompressed.
+
+        :param since: Only receipts issued at or after this datetime, naive datetimes are treated as UTC.
+        :param until: Only receipts issued at or before this datetime.
+        """
+        since, until = (
+            date.replace(tzinfo=timezone.utc) if date and not date.tzinfo else date for date in (since, until)
+        )
+        entries = []
+        for offset, length, date in self._entries.values():
+            date = parse_date(date) if date else None
+            if date is None or ((not since or date >= since) and (not until or date <= until)):
+                entries.append((date or datetime.min.replace(tzinfo=timezone.utc), offset, length))
+        for _, offset, length in sorted(entries, reverse=True):
+            yield self._read(offset, length)
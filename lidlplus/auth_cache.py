@@ -0,0 +1,69 @@
+"""
+Cache for login related lookups
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def _default_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "lidl-plus" / "auth.json"
+
+
+class AuthCache:
+    """
+    Small json file cache shared by all api instances and cli runs.
+
+    Used for the OpenID discovery document and resolved web driver paths, which are expensive to look up
+    but rarely change. Entries are kept in memory after the file was read once.
+    """
+
+    def __init__(self, path=None):
+        self._path = Path(path) if path else _default_path()
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                self._data = json.loads(self._path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+            temp.write_text(json.dumps(self._data), encoding="utf-8")
+            os.replace(temp, self._path)
+        except OSError:
+            pass
+
+    def get(self, key, ttl=None):
+        """Get cached value or None if missing or older than ttl seconds"""
+        with self._lock:
+            if not (entry := self._load().get(key)):
+                return None
+            if ttl is not None and time.time() - entry["time"] > ttl:
+                return None
+            return entry["value"]
+
+    def set(self, key, value):
+        """Cache a json serializable value"""
+        with self._lock:
+            self._load()[key] = {"time": time.time(), "value": value}
+            self._save()
+
+    def delete(self, key):
+        """Remove cached value"""
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+
+DEFAULT_CACHE = AuthCache()
@@ -0,0 +1,353 @@
+"""
+Web browser login
+"""
+
+import atexit
+import html
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from getuseragent import UserAgent
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+from seleniumwire import webdriver
+from seleniumwire.utils import decode
+from webdriver_manager.chrome import ChromeDriverManager
+from webdriver_manager.firefox import GeckoDriverManager
+from webdriver_manager.core.os_manager import ChromeType
+
+from lidlplus.auth_cache import DEFAULT_CACHE
+from lidlplus.exceptions import WebBrowserException, LoginError, LegalTermsException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# pylint: disable=too-few-public-methods
+class BrowserLogin:
+    """
+    Simulate the app login in a selenium controlled web browser.
+
+    This module pulls in the whole auth stack, so it is only imported once a browser login is started.
+    """
+
+    def __init__(self, auth_api, user_agent_os, auth_cache, phase=None):
+        """
+        :param phase: Context manager factory timing the login steps by name.
+        """
+        self._auth_api = auth_api
+        self._os = user_agent_os
+        self._auth_cache = auth_cache
+        self._phase = phase or (lambda name: nullcontext())
+
+    def _init_chrome(self, headless=True):
+        user_agent = UserAgent(self._os.lower()).Random()
+        logging.getLogger("WDM").setLevel(logging.NOTSET)
+        options = webdriver.ChromeOptions()
+        if headless:
+            options.add_argument("headless")
+        options.add_experimental_option("mobileEmulation", {"userAgent": user_agent})
+        if (driver := self._auth_cache.get("driver:chrome")) and os.path.exists(driver):
+            try:
+                return webdriver.Chrome(service=Service(driver), options=options)
+            except Exception:  # pylint: disable=broad-except
+                self._auth_cache.delete("driver:chrome")
+        for chrome_type in [ChromeType.GOOGLE, ChromeType.MSEDGE, ChromeType.CHROMIUM]:
+            try:
+                driver = ChromeDriverManager(chrome_type=chrome_type).install()
+                browser = webdriver.Chrome(service=Service(driver), options=options)
+                self._auth_cache.set("driver:chrome", driver)
+                return browser
+            except AttributeError:
+                continue
+        raise WebBrowserException("Unable to find a suitable Chrome driver")
+
+    def _init_firefox(self, headless=True):
+        user_agent = UserAgent(self._os.lower()).Random()
+        logging.getLogger("WDM").setLevel(logging.NOTSET)
+        options = webdriver.FirefoxOptions()
+        if headless:
+            options.headless = True
+        profile = webdriver.FirefoxProfile()
+        profile.set_preference("general.useragent.override", user_agent)
+        if not ((driver := self._auth_cache.get("driver:firefox")) and os.path.exists(driver)):
+            driver = GeckoDriverManager().install()
+            self._auth_cache.set("driver:firefox", driver)
+        return webdriver.Firefox(
+            executable_path=driver,
+            firefox_binary="/usr/bin/firefox",
+            options=options,
+            firefox_profile=profile,
+        )
+
+    def start_browser(self, headless=True):
+        """Start a new web browser, chrome is preferred over firefox"""
+        try:
+            return self._init_chrome(headless=headless)
+        except Exception as exc1:  # pylint: disable=broad-except
+            try:
+                return self._init_firefox(headless=headless)
+            except Exception as exc2:
+                raise WebBrowserException from exc1 and exc2
+
+    @staticmethod
+    def _accept_legal_terms(browser, wait, accept=True):
+        wait.until(expected_conditions.visibility_of_element_located((By.ID, "checkbox_Accepted"))).click()
+        if not accept:
+            title = browser.find_element(By.TAG_NAME, "h2").text
+            raise LegalTermsException(title)
+        browser.find_element(By.TAG_NAME, "button").click()
+
+    def _parse_code(self, browser, wait, accept_legal_terms=True):
+        for request in reversed(browser.requests):
+            if f"{self._auth_api}/connect" not in request.url:
+                continue
+            location = request.response.headers.get("Location", "")
+            if "legalTerms" in location:
+                self._accept_legal_terms(browser, wait, accept=accept_legal_terms)
+                return self._parse_code(browser, wait, False)
+            if code := re.findall("code=([0-9A-F]+)", location):
+                return code[0]
+        return ""
+
+    def _click(self, browser, button, request=""):
+        del browser.requests
+        browser.backend.storage.clear_requests()
+        browser.find_element(*button).click()
+        self._check_input_error(browser)
+        if request and browser.wait_for_request(request, 10):
+            self._check_input_error(browser)
+
+    @staticmethod
+    def _check_input_error(browser):
+        if errors := browser.find_elements(By.CLASS_NAME, "input-error-message"):
+            for error in errors:
+                if error.text:
+                    raise LoginError(error.text)
+
+    def _check_login_error(self, browser):
+        response = browser.wait_for_request(f"{self._auth_api}/Account/Login.*", 10).response
+        body = html.unescape(decode(response.body, response.headers.get("Content-Encoding", "identity")).decode())
+        if error := re.findall('app-errors="\\{[^:]*?:.(.*?).}', body):
+            raise LoginError(error[0])
+
+    def _check_2fa_auth(self, browser, wait, verify_mode="phone", verify_token_func=None):
+        if verify_mode not in ["phone", "email"]:
+            raise ValueError(f'Unknown 2fa-mode "{verify_mode}" - Only "phone" or "email" supported')
+        response = browser.wait_for_request(f"{self._auth_api}/Account/Login.*", 10).response
+        if "/connect/authorize/callback" not in response.headers.get("Location"):
+            element = wait.until(expected_conditions.visibility_of_element_located((By.CLASS_NAME, verify_mode)))
+            element.find_element(By.TAG_NAME, "button").click()
+            verify_code = verify_token_func()
+            browser.find_element(By.NAME, "VerificationCode").send_keys(verify_code)
+            self._click(browser, (By.CLASS_NAME, "role_next"))
+
+    @contextmanager
+    def _browser(self, kwargs):
+        if pool := kwargs.get("browser_pool"):
+            with self._phase("browser.borrow"):
+                browser = pool.acquire()
+            try:
+                yield browser
+            finally:
+                pool.release(browser)
+        else:
+            with self._phase("browser.start"):
+                browser = self.start_browser(headless=kwargs.get("headless", True))
+            try:
+                yield browser
+            finally:
+                browser.quit()
+
+    def login(self, login_url, phone, password, **kwargs):
+        """
+        Login in web browser and return the authorization code
+
+        :param browser_pool: `BrowserPool` to borrow a running browser from, otherwise a new browser
+            is started and quit afterwards.
+        """
+        with self._browser(kwargs) as browser:
+            with self._phase("browser.open"):
+                browser.get(login_url)
+                wait = WebDriverWait(browser, 10)
+                wait.until(expected_conditions.visibility_of_element_located((By.ID, "button_welcome_login"))).click()
+            with self._phase("browser.credentials"):
+                wait.until(expected_conditions.visibility_of_element_located((By.NAME, "EmailOrPhone"))).send_keys(
+                    phone
+                )
+                self._click(browser, (By.ID, "button_btn_submit_email"))
+                self._click(
+                    browser,
+                    (By.ID, "button_btn_submit_email"),
+                    request=f"{self._auth_api}/api/phone/exists.*",
+                )
+                wait.until(expected_conditions.element_to_be_clickable((By.ID, "field_Password"))).send_keys(password)
+                self._click(browser, (By.ID, "button_submit"))
+                self._check_login_error(browser)
+            with self._phase("browser.2fa"):
+                self._check_2fa_auth(
+                    browser,
+                    wait,
+                    kwargs.get("verify_mode", "phone"),
+                    kwargs.get("verify_token_func"),
+                )
+            with self._phase("browser.callback"):
+                browser.wait_for_request(f"{self._auth_api}/connect.*")
+                return self._parse_code(browser, wait, accept_legal_terms=kwargs.get("accept_legal_terms", True))
+
+
+# pylint: disable=too-many-instance-attributes
+class BrowserPool:
+    """
+    Running web browsers shared by many logins.
+
+    Returned chrome browsers get the cookies of all sites, their storage and recorded requests cleared and
+    are handed to the next login. Firefox can only clear the site it shows, so a returned firefox is quit and
+    replaced in background by one with a fresh profile. At most size browsers run at once, further logins
+    wait for a free one. All browsers are quit on `close()`, at the latest when the interpreter exits.
+    """
+
+    def __init__(self, size=2, headless=True, user_agent_os="iOs", auth_cache=None):
+        """
+        :param size: Maximum number of running browsers and parallel logins.
+        :param user_agent_os: Operating system of the random mobile user agent.
+        :param auth_cache: Cache of the resolved web driver paths, see `LidlPlusApi`.
+        """
+        self._size = size
+        self._headless = headless
+        self._launcher = BrowserLogin(None, user_agent_os, auth_cache or DEFAULT_CACHE)
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._browsers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def _start(self):
+        browser = self._launcher.start_browser(headless=self._headless)
+        with self._lock:
+            self._browsers.add(browser)
+            closed = self._closed
+        if closed:
+            self._quit(browser)
+            raise WebBrowserException("Browser pool is closed")
+        return browser
+
+    def _quit(self, browser):
+        with self._lock:
+            self._browsers.discard(browser)
+        try:
+            browser.quit()
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.debug("Failed to quit browser - %s", exc)
+
+    @staticmethod
+    def _reset(browser):
+        if not hasattr(browser, "execute_cdp_cmd"):
+            # without the devtools protocol only the current site would be cleared
+            return False
+        try:
+            browser.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            browser.delete_all_cookies()
+            try:
+                browser.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            except Exception:  # pylint: disable=broad-except
+                pass
+            browser.get("about:blank")
+            del browser.requests
+            browser.backend.storage.clear_requests()
+            return True
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.debug("Failed to reset browser, quitting it - %s", exc)
+            return False
+
+    def warm(self, count=None):
+        """Start browsers in parallel until count of them run, defaults to size"""
+        slots = 0
+        # pylint: disable=consider-using-with
+        while slots < min(count or self._size, self._size) - len(self._browsers) and self._slots.acquire(False):
+            slots += 1
+        if not slots:
+            return
+        with ThreadPoolExecutor(slots) as executor:
+            futures = [executor.submit(self._start) for _ in range(slots)]
+        errors = []
+        for future in futures:
+            try:
+                browser = future.result()
+                with self._lock:
+                    self._idle.append(browser)
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+            finally:
+                self._slots.release()
+        if errors:
+            raise errors[0]
+
+    def acquire(self, timeout=None):
+        """
+        Borrow a browser, starting one if none is idle.
+
+        :param timeout: Seconds to wait for a free browser, waits forever if None.
+        """
+        if not self._slots.acquire(timeout=timeout):  # pylint: disable=consider-using-with
+            raise WebBrowserException(f"No free browser within {timeout}s")
+        try:
+            with self._lock:
+                if self._closed:
+                    raise WebBrowserException("Browser pool is closed")
+                browser = self._idle.pop() if self._idle else None
+            return browser or self._start()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, browser):
+        """Return a borrowed browser, it's quit if it can't be reset or the pool is closed"""
+        try:
+            reusable = self._reset(browser)
+            with self._lock:
+                if reusable and not self._closed:
+                    self._idle.append(browser)
+                    return
+            self._quit(browser)
+        finally:
+            self._slots.release()
+        if not self._closed:
+            threading.Thread(target=self._replace, daemon=True).start()
+
+    def _replace(self):
+        """Start a browser with a fresh profile in place of a quit one, unless all slots are busy"""
+        if not self._slots.acquire(False):  # pylint: disable=consider-using-with
+            return
+        try:
+            browser = self._start()
+            with self._lock:
+                if keep := not self._closed and len(self._browsers) <= self._size:
+                    self._idle.append(browser)
+            if not keep:
+                self._quit(browser)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.debug("Failed to start replacement browser - %s", exc)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Quit idle browsers now and borrowed ones once they are returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            self._quit(browser)
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,34 @@
+"""
+Coupon activation planning
+"""
+
+from datetime import datetime, timezone
+
+from lidlplus.utils import parse_date
+
+
+def _is_valid(start, end, now):
+    return parse_date(start) <= now <= parse_date(end)
+
+
+def coupon_plan(coupons, promotions, now=None):
+    """
+    Build the list of coupons which can be activated.
+
+    :param coupons: Response of `LidlPlusApi.coupons()`.
+    :param promotions: Response of `LidlPlusApi.coupon_promotions_v1()`, some coupons are only available there.
+    :param now: Point in time to check validity against, defaults to now.
+    :return: List of dicts with id, title and api version of each coupon to activate.
+    """
+    now = now or datetime.now(timezone.utc)
+    plan = []
+    for section in coupons.get("sections", {}):
+        for coupon in section.get("coupons", {}):
+            if not coupon["isActivated"] and _is_valid(coupon["startValidityDate"], coupon["endValidityDate"], now):
+                plan.append({"id": coupon["id"], "title": coupon["title"], "api": "v2"})
+    for section in promotions.get("sections", {}):
+        for coupon in section.get("promotions", {}):
+            validity = coupon.get("validity", {})
+            if not coupon["isActivated"] and _is_valid(validity["start"], validity["end"], now):
+                plan.append({"id": coupon["promotionId"], "title": coupon["title"], "api": "v1"})
+    return plan
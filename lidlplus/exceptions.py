@@ -2,6 +2,8 @@
 Exeptions
 """
 
+import requests
+
 
 class WebBrowserException(Exception):
     """No Browser installed"""
@@ -17,3 +19,46 @@ class LegalTermsException(Exception):
 
 class MissingLogin(Exception):
     """Login necessary"""
+
+
+class ApiError(requests.HTTPError):
+    """Api request failed"""
+
+    def __init__(self, message, status=None, response=None):
+        super().__init__(message, response=response)
+        self.status = status
+
+    @classmethod
+    def from_response(cls, response, retry_after=None):
+        """Create the typed error matching the status of a failed response"""
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+        message = f"{status} error for {getattr(response, 'url', 'request')}"
+        if status == 401:
+            return UnauthorizedError(message, status, response)
+        if status == 404:
+            return NotFoundError(message, status, response)
+        if status == 429:
+            return RateLimitError(message, status, response, retry_after=retry_after)
+        if status >= 500:
+            return ServerError(message, status, response)
+        return ApiError(message, status, response)
+
+
+class UnauthorizedError(ApiError):
+    """Token was rejected, even after renewing it"""
+
+
+class NotFoundError(ApiError):
+    """Requested object doesn't exist"""
+
+
+class RateLimitError(ApiError):
+    """Still rate limited after all retries"""
+
+    def __init__(self, message, status=None, response=None, retry_after=None):
+        super().__init__(message, status, response)
+        self.retry_after = retry_after
+
+
+class ServerError(ApiError):
+    """Api failed with a server error after all retries"""
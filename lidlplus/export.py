@@ -0,0 +1,124 @@
+"""
+Line item export
+"""
+
+import csv
+import json
+from itertools import islice
+
+from lidlplus.models import Receipt
+
+COLUMNS = [
+    "ticket_id",
+    "date",
+    "store_id",
+    "store_name",
+    "article",
+    "code",
+    "quantity",
+    "is_weight",
+    "unit_price",
+    "amount",
+    "discount",
+    "discount_descriptions",
+]
+FORMATS = ["csv", "ndjson", "parquet"]
+
+
+def line_items(receipts):
+    """
+    Flatten receipts into one row per line item.
+
+    :param receipts: Iterable of receipt dicts or `lidlplus.models.Receipt`.
+    :return: Generator of row dicts with the keys of `COLUMNS`, amounts as Decimal.
+    """
+    for receipt in receipts:
+        if not isinstance(receipt, Receipt):
+            receipt = Receipt(receipt)
+        store = receipt.store
+        for item in receipt.items:
+            yield {
+                "ticket_id": receipt.id,
+                "date": receipt.date,
+                "store_id": store.get("id"),
+                "store_name": store.get("name"),
+                "article": item.name,
+                "code": item.code,
+                "quantity": item.quantity,
+                "is_weight": item.is_weight,
+                "unit_price": item.unit_price,
+                "amount": item.amount,
+                "discount": item.discount_total,
+                "discount_descriptions": "; ".join(description or "" for description, _ in item.discounts),
+            }
+
+
+def _plain(row):
+    return {
+        **row,
+        "date": row["date"].isoformat() if row["date"] else None,
+        **{key: float(row[key]) if row[key] is not None else None for key in ("quantity", "unit_price", "amount")},
+        "discount": float(row["discount"]),
+    }
+
+
+def write_csv(rows, file):
+    """Write rows as csv with header"""
+    writer = csv.DictWriter(file, fieldnames=COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "date": row["date"].isoformat() if row["date"] else None})
+
+
+def write_ndjson(rows, file):
+    """Write rows as one json object per line"""
+    for row in rows:
+        file.write(json.dumps(_plain(row)) + "\n")
+
+
+def write_parquet(rows, path, batch_size=10000):
+    """Write rows as parquet file in batches, needs pyarrow"""
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("ticket_id", pa.string()),
+            ("date", pa.timestamp("us", tz="UTC")),
+            ("store_id", pa.string()),
+            ("store_name", pa.string()),
+            ("article", pa.string()),
+            ("code", pa.string()),
+            ("quantity", pa.float64()),
+            ("is_weight", pa.bool_()),
+            ("unit_price", pa.float64()),
+            ("amount", pa.float64()),
+            ("discount", pa.float64()),
+            ("discount_descriptions", pa.string()),
+        ]
+    )
+    rows = iter(rows)
+    with pq.ParquetWriter(str(path), schema) as writer:
+        while batch := list(islice(rows, batch_size)):
+            batch = [{**_plain(row), "date": row["date"]} for row in batch]
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def export(receipts, fmt, file):
+    """
+    Stream line items of receipts to a file.
+
+    :param receipts: Iterable of receipts, consumed lazily.
+    :param fmt: One of `FORMATS`.
+    :param file: Text file object for csv and ndjson, path for parquet.
+    """
+    rows = line_items(receipts)
+    if fmt == "csv":
+        write_csv(rows, file)
+    elif fmt == "ndjson":
+        write_ndjson(rows, file)
+    elif fmt == "parquet":
+        write_parquet(rows, file)
+    else:
+        raise ValueError(f'Unknown export format "{fmt}" - Only {", ".join(FORMATS)} supported')
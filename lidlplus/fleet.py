@@ -0,0 +1,164 @@
+"""
+Multi account orchestration
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, zip_longest
+from urllib.parse import urlsplit
+
+from lidlplus.api import LidlPlusApi
+from lidlplus.ratelimit import RateLimiter
+from lidlplus.session import create_session
+from lidlplus.token_store import FileTokenStore
+
+
+class _HostLimitedSession:
+    """Session wrapper limiting parallel requests per host across all accounts"""
+
+    def __init__(self, session, per_host):
+        self._session = session
+        self._limits = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        """Send request once a slot for the host is free"""
+        with self._lock:
+            limit = self._limits[urlsplit(url).netloc]
+        with limit:
+            return self._session.request(method, url, **kwargs)
+
+    def close(self):
+        """Close wrapped session"""
+        self._session.close()
+
+
+def _round_robin(groups):
+    """Interleave task lists so every account gets its turn"""
+    return [task for task in chain.from_iterable(zip_longest(*groups)) if task is not None]
+
+
+class LidlPlusFleet:
+    """
+    Run api work for many accounts on one shared worker pool.
+
+    All accounts share one pooled session and rate limiter. Parallel requests are capped per host and per account,
+    and per account work is interleaved so large accounts don't starve small ones.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, accounts, max_workers=16, per_account=2, per_host=8, *, hooks=None):
+        """
+        :param accounts: List of account dicts with language, country, refresh_token and optional
+            name and token_file.
+        :param max_workers: Size of the shared worker pool.
+        :param per_account: Maximum parallel tasks per account.
+        :param per_host: Maximum parallel requests per api host.
+        :param hooks: Instrumentation hooks passed to every account, see `LidlPlusApi`.
+        """
+        self._max_workers = max_workers
+        self._session = _HostLimitedSession(create_session(pool_maxsize=per_host), per_host)
+        rate_limiter = RateLimiter()
+        self._accounts = {}
+        self._account_limits = {}
+        for i, account in enumerate(accounts):
+            name = account.get("name") or f"{account['country'].upper()}-{i}"
+            token_store = FileTokenStore(account["token_file"]) if account.get("token_file") else None
+            api = LidlPlusApi(
+                account["language"],
+                account["country"],
+                account["refresh_token"],
+                session=self._session,
+                token_store=token_store,
+                rate_limiter=rate_limiter,
+                hooks=hooks,
+            )
+            self._accounts[name] = api
+            self._account_limits[name] = threading.BoundedSemaphore(per_account)
+
+    @property
+    def accounts(self):
+        """Dict of account name to api connector"""
+        return dict(self._accounts)
+
+    def close(self):
+        """Close shared session"""
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self, name, func, *args):
+        with self._account_limits[name]:
+            try:
+                return func(self._accounts[name], *args)
+            except Exception as exc:  # pylint: disable=broad-except
+                return exc
+
+    def run(self, tasks):
+        """
+        Run tasks on the shared pool.
+
+        :param tasks: Dict of account name to list of (func, *args) tuples, called as func(api, *args).
+        :return: Dict of account name to list of results or raised exceptions, in task order.
+        """
+        groups = [[(name, i, task) for i, task in enumerate(items)] for name, items in tasks.items()]
+        results = {name: [None] * len(items) for name, items in tasks.items()}
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [(name, i, executor.submit(self._run, name, *task)) for name, i, task in _round_robin(groups)]
+        for name, i, future in futures:
+            results[name][i] = future.result()
+        return results
+
+    def map(self, func, *args):
+        """
+        Call func(api, *args) once for every account.
+
+        :return: Dict of account name to result or raised exception.
+        """
+        results = self.run({name: [(func, *args)] for name in self._accounts})
+        return {name: result[0] for name, result in results.items()}
+
+    def loyalty_ids(self):
+        """Get loyalty ids of all accounts"""
+        return self.map(LidlPlusApi.loyalty_id)
+
+    def receipts(self, latest_only=False):
+        """
+        Get full receipts of all accounts.
+
+        :param latest_only: Only fetch the newest receipt of each account.
+        :return: Dict of account name to list of receipts or raised exceptions.
+        """
+        if latest_only:
+            tickets = self.map(lambda api: [next(api.iter_tickets(prefetch=False))])
+        else:
+            tickets = self.map(LidlPlusApi.tickets)
+        tasks = {
+            name: [(LidlPlusApi.ticket, ticket["id"]) for ticket in items]
+            for name, items in tickets.items()
+            if not isinstance(items, Exception)
+        }
+        results = self.run(tasks)
+        return {name: results.get(name, tickets[name]) for name in tickets}
+
+    def activate_coupons(self, dry_run=False, retries=2):
+        """
+        Activate all valid coupons of all accounts.
+
+        :return: Dict of account name to `activate_all_coupons` like report or raised exception.
+        """
+        plans = self.map(lambda api: api.activate_all_coupons(max_workers=2, dry_run=True))
+        if dry_run:
+            return plans
+        tasks = {
+            name: [(LidlPlusApi.activate_planned_coupon, coupon, retries) for coupon in plan]
+            for name, plan in plans.items()
+            if not isinstance(plan, Exception)
+        }
+        results = self.run(tasks)
+        return {name: results.get(name, plans[name]) for name in plans}
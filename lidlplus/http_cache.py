@@ -0,0 +1,152 @@
+"""
+Http response cache
+"""
+
+import base64
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class MemoryCacheBackend:
+    """Least recently used in-memory cache entries"""
+
+    def __init__(self, maxsize=256):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get entry or None"""
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Store entry and evict the least recently used ones"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskCacheBackend:
+    """Cache entries in a sqlite file, shared between processes"""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get entry or None"""
+        with self._lock:
+            row = self._connection.execute("SELECT entry FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, entry):
+        """Store entry"""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?)", (key, json.dumps(entry)))
+
+    def delete(self, key):
+        """Remove entry"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+class ResponseCache:
+    """
+    Cache GET responses honoring Cache-Control, ETag and Last-Modified.
+
+    Responses without caching headers are kept for a fallback ttl. Expired entries with a validator
+    are revalidated with a conditional request, so unchanged payloads aren't downloaded again.
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        """
+        :param backend: `MemoryCacheBackend` (default) or `DiskCacheBackend`.
+        :param ttl: Seconds to keep responses the server sent no freshness information for.
+        """
+        self._backend = backend or MemoryCacheBackend()
+        self._ttl = ttl
+
+    def _expires(self, headers, ttl):
+        cache_control = headers.get("Cache-Control", "").lower()
+        if "no-cache" in cache_control:
+            return 0
+        if max_age := re.findall(r"max-age=(\d+)", cache_control):
+            return time.time() + int(max_age[0])
+        if expires := headers.get("Expires"):
+            try:
+                return parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return 0
+        return time.time() + (self._ttl if ttl is None else ttl)
+
+    @staticmethod
+    def _response(entry, url):
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = url
+        response.encoding = "utf-8"
+        # pylint: disable=protected-access
+        response._content = base64.b64decode(entry["body"])
+        return response
+
+    def _store(self, key, response, ttl):
+        headers = {name: value for name, value in response.headers.items() if name.lower() != "content-encoding"}
+        entry = {
+            "status": response.status_code,
+            "headers": headers,
+            "body": base64.b64encode(response.content).decode(),
+            "expires": self._expires(response.headers, ttl),
+        }
+        self._backend.set(key, entry)
+
+    def fetch(self, key, url, send, headers, ttl=None):
+        """
+        Get response from cache or by calling `send(headers)`.
+
+        :param key: Cache key, has to identify account and url.
+        :param url: Requested url.
+        :param send: Function sending the request with the passed headers.
+        :param headers: Request headers, conditional headers are added for revalidation.
+        :param ttl: Fallback ttl overriding the default one for this request.
+        """
+        entry = self._backend.get(key)
+        if entry and time.time() < entry["expires"]:
+            return self._response(entry, url)
+        if entry:
+            if etag := entry["headers"].get("ETag"):
+                headers = {**headers, "If-None-Match": etag}
+            if last_modified := entry["headers"].get("Last-Modified"):
+                headers = {**headers, "If-Modified-Since": last_modified}
+        response = send(headers)
+        if response.status_code == 304 and entry:
+            entry["expires"] = self._expires(response.headers, ttl)
+            self._backend.set(key, entry)
+            return self._response(entry, url)
+        if response.status_code == 200 and "no-store" not in response.headers.get("Cache-Control", "").lower():
+            self._store(key, response, ttl)
+        return response
+
+    def invalidate(self, key):
+        """Drop cached response"""
+        self._backend.delete(key)
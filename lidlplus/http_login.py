@@ -0,0 +1,178 @@
+"""
+Browserless login
+"""
+
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+
+from lidlplus.exceptions import LoginError, LegalTermsException
+
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class _PageParser(HTMLParser):
+    """Collect forms, input errors and the heading of a login page"""
+
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.errors = []
+        self.heading = ""
+        self._classes = []
+        self._form = None
+        self._capture = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        if errors := re.findall("\\{[^:]*?:.(.*?).}", attrs.get("app-errors", "")):
+            self.errors += errors
+        if tag not in _VOID_TAGS:
+            self._classes.append(attrs.get("class", ""))
+        if "input-error-message" in attrs.get("class", ""):
+            self._capture = "error"
+            self.errors.append("")
+        elif tag == "h2" and not self.heading:
+            self._capture = "heading"
+        if tag == "form":
+            context = " ".join(self._classes)
+            self._form = {"action": attrs.get("action", ""), "method": attrs.get("method", "get"), "context": context}
+            self._form.update({"fields": {}, "options": [], "buttons": []})
+            self.forms.append(self._form)
+        elif tag in ("input", "button", "textarea", "select") and self._form is not None and attrs.get("name"):
+            kind = attrs.get("type", "submit" if tag == "button" else "text").lower()
+            if kind in ("checkbox", "radio") and "checked" not in attrs:
+                self._form["options"].append((attrs["name"], attrs.get("value") or "true"))
+            elif kind in ("submit", "image"):
+                classes = self._classes if tag == "button" else [*self._classes, attrs.get("class", "")]
+                self._form["buttons"].append((attrs["name"], attrs.get("value", ""), " ".join(classes)))
+            elif tag != "button":
+                self._form["fields"][attrs["name"]] = attrs.get("value", "")
+
+    def handle_endtag(self, tag):
+        if tag not in _VOID_TAGS and self._classes:
+            self._classes.pop()
+        if tag == "form":
+            self._form = None
+        self._capture = None
+
+    def handle_data(self, data):
+        if self._capture == "error":
+            self.errors[-1] += data.strip()
+        elif self._capture == "heading":
+            self.heading += data.strip()
+
+
+# pylint: disable=too-few-public-methods
+class HttpLogin:
+    """
+    Drive the Lidl account login forms with plain http requests instead of a web browser.
+
+    The pages are parsed for their forms, known fields are filled and the forms are submitted
+    until the authorization server redirects to the app callback url containing the code.
+    """
+
+    _MAX_STEPS = 20
+
+    def __init__(self, callback_url, session=None, timeout=10):
+        """
+        :param callback_url: Redirect uri of the app, the code is taken from the redirect to it.
+        :param session: Requests session to use, a fresh one avoids leaking cookies between logins.
+        """
+        self._callback_url = callback_url
+        self._session = session or requests.Session()
+        self._timeout = timeout
+
+    def _follow(self, response):
+        for _ in range(self._MAX_STEPS):
+            if not response.is_redirect:
+                return response, ""
+            location = response.headers["Location"]
+            if location.startswith(self._callback_url):
+                if code := re.findall("code=([0-9A-F]+)", location):
+                    return response, code[0]
+                raise LoginError(f"No authorization code in callback {location}")
+            url = urljoin(response.url, location)
+            response = self._session.get(url, allow_redirects=False, timeout=self._timeout)
+        raise LoginError("Too many redirects")
+
+    @staticmethod
+    def _verify_button(form, verify_mode):
+        """Submit button of the 2fa method, identified by its value or the class of an enclosing element"""
+        for button in form["buttons"]:
+            if button[1] == verify_mode or verify_mode in button[2].split():
+                return button
+        return None
+
+    @staticmethod
+    def _select_form(page, verify_mode):
+        known = ("EmailOrPhone", "Password", "VerificationCode")
+        for form in page.forms:
+            if any(field in form["fields"] for field in known) or any(
+                name == "Accepted" for name, _ in form["options"]
+            ):
+                return form
+        for form in page.forms:
+            if (
+                verify_mode in form["context"].split()
+                or HttpLogin._verify_button(form, verify_mode)
+                or any(value == verify_mode for _, value in form["options"])
+            ):
+                return form
+        if forms := [form for form in page.forms if form["method"].lower() == "post"]:
+            return forms[0]
+        raise LoginError("Unexpected login page")
+
+    @staticmethod
+    def _fill_form(form, page, phone, password, **kwargs):
+        verify_mode = kwargs.get("verify_mode", "phone")
+        data = dict(form["fields"])
+        if "EmailOrPhone" in data:
+            data["EmailOrPhone"] = phone
+        if "Password" in data:
+            data["Password"] = password
+        if "VerificationCode" in data:
+            data["VerificationCode"] = kwargs["verify_token_func"]()
+        for name, value in form["options"]:
+            if name == "Accepted":
+                if not kwargs.get("accept_legal_terms", True):
+                    raise LegalTermsException(page.heading)
+                data[name] = value
+            elif value == verify_mode:
+                data[name] = value
+        # the server tells the steps apart by the name and value of the clicked button
+        if button := HttpLogin._verify_button(form, verify_mode) or next(iter(form["buttons"]), None):
+            data[button[0]] = button[1]
+        return data
+
+    def login(self, login_url, phone, password, **kwargs):
+        """
+        Login and return the authorization code.
+
+        :param login_url: Authorization url to start the login at.
+        :param verify_token_func: Function returning the 2fa code.
+        :param verify_mode: 2fa method, "phone" or "email".
+        :param accept_legal_terms: Accept updated legal terms, otherwise `LegalTermsException` is raised.
+        """
+        verify_mode = kwargs.get("verify_mode", "phone")
+        if verify_mode not in ["phone", "email"]:
+            raise ValueError(f'Unknown 2fa-mode "{verify_mode}" - Only "phone" or "email" supported')
+        response = self._session.get(login_url, allow_redirects=False, timeout=self._timeout)
+        for _ in range(self._MAX_STEPS):
+            response, code = self._follow(response)
+            if code:
+                return code
+            page = _PageParser()
+            page.feed(response.text)
+            if errors := [error for error in page.errors if error]:
+                raise LoginError(errors[0])
+            form = self._select_form(page, verify_mode)
+            data = self._fill_form(form, page, phone, password, **kwargs)
+            url = urljoin(response.url, form["action"] or response.url)
+            if form["method"].lower() == "post":
+                response = self._session.post(url, data=data, allow_redirects=False, timeout=self._timeout)
+            else:
+                response = self._session.get(url, params=data, allow_redirects=False, timeout=self._timeout)
+        raise LoginError("Login did not finish")
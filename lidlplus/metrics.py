@@ -0,0 +1,164 @@
+"""
+Request instrumentation
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+RequestEvent = namedtuple("RequestEvent", "endpoint method url status latency bytes retries error")
+RequestEvent.__doc__ = """
+Finished api request, passed to the hooks of `LidlPlusApi`.
+
+Latency is in seconds including retries, status is None if no response was received and error is
+the raised exception or None.
+"""
+
+PhaseEvent = namedtuple("PhaseEvent", "name latency error")
+PhaseEvent.__doc__ = """Finished step without own api request like the login in the web browser"""
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# pylint: disable=too-few-public-methods
+class LoggingHook:
+    """Log every event"""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self._logger = logger or logging.getLogger("lidlplus.metrics")
+        self._level = level
+
+    def __call__(self, event):
+        if isinstance(event, RequestEvent):
+            self._logger.log(
+                self._level,
+                "%s %s %s in %.0f ms, %d bytes, %d retries",
+                event.endpoint,
+                event.method,
+                event.status or event.error,
+                event.latency * 1000,
+                event.bytes,
+                event.retries,
+            )
+        else:
+            self._logger.log(self._level, "%s in %.0f ms", event.name, event.latency * 1000)
+
+
+# pylint: disable=too-few-public-methods
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Count value in its bucket"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Prometheus style counters and latency histograms of all events.
+
+    Use it as hook and expose `render()` in the Prometheus text format, e.g. from a web handler.
+    """
+
+    def __init__(self, prefix="lidlplus", buckets=DEFAULT_BUCKETS):
+        self._prefix = prefix
+        self._buckets = tuple(buckets)
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        """Increase counter by value"""
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, labels, value):
+        """Add value to histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(self._buckets)
+            self._histograms[key].observe(value)
+
+    def __call__(self, event):
+        if isinstance(event, RequestEvent):
+            labels = {"endpoint": event.endpoint, "status": str(event.status or "error")}
+            self.inc("requests_total", labels)
+            self.inc("response_bytes_total", {"endpoint": event.endpoint}, event.bytes)
+            self.inc("retries_total", {"endpoint": event.endpoint}, event.retries)
+            self.observe("request_duration_seconds", {"endpoint": event.endpoint}, event.latency)
+        else:
+            self.observe("phase_duration_seconds", {"phase": event.name}, event.latency)
+
+    def counter(self, name, **labels):
+        """Get current value of a counter"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def _labels(labels, **extra):
+        labels = [*labels, *extra.items()]
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}" if labels else ""
+
+    def render(self):
+        """Get all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {self._prefix}_{name} counter")
+                for (key, labels), value in sorted(self._counters.items()):
+                    if key == name:
+                        lines.append(f"{self._prefix}_{name}{self._labels(labels)} {value:g}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {self._prefix}_{name} histogram")
+                for (key, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{self._prefix}_{name}_bucket{self._labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{self._prefix}_{name}_sum{self._labels(labels)} {histogram.sum:g}")
+                    lines.append(f"{self._prefix}_{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Timings:
+    """Collect latencies per endpoint and phase for a breakdown report"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        name = event.endpoint if isinstance(event, RequestEvent) else event.name
+        with self._lock:
+            phase = self._phases.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "retries": 0})
+            phase["count"] += 1
+            phase["total"] += event.latency
+            phase["max"] = max(phase["max"], event.latency)
+            phase["bytes"] += getattr(event, "bytes", 0)
+            phase["retries"] += getattr(event, "retries", 0)
+
+    def report(self):
+        """Get the breakdown as text table, phases run in parallel can sum up to more than the wall time"""
+        lines = [f"{'phase':<24}{'count':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}{'kB':>9}{'retries':>9}"]
+        with self._lock:
+            phases = sorted(self._phases.items(), key=lambda item: -item[1]["total"])
+        for name, phase in phases:
+            lines.append(
+                f"{name:<24}{phase['count']:>7}{phase['total'] * 1000:>11.1f}"
+                f"{phase['total'] / phase['count'] * 1000:>10.1f}{phase['max'] * 1000:>10.1f}"
+                f"{phase['bytes'] / 1024:>9.1f}{phase['retries']:>9}"
+            )
+        lines.append(f"{'wall time':<24}{'':>7}{(time.perf_counter() - self._start) * 1000:>11.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,201 @@
+"""
+Typed views on api responses
+"""
+
+import json
+from decimal import Decimal
+
+from lidlplus.utils import parse_date
+
+try:
+    import orjson
+
+    _loads = orjson.loads  # pylint: disable=no-member
+except ImportError:
+    _loads = json.loads
+
+
+def parse_amount(value):
+    """Parse api amount like "1.234,56", "2.19" or 2.19 as Decimal"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if "," in value:
+        value = value.replace(".", "").replace(",", ".")
+    return Decimal(value)
+
+
+class _Model:
+    """
+    Lazily decoded api object.
+
+    Created from the raw response bytes, the json is only decoded on first access. Parsed values
+    are cached, raw dict access stays available via `data`, item access and `get`.
+    """
+
+    __slots__ = ("_raw", "_data", "_parsed")
+
+    def __init__(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview, str)):
+            self._raw, self._data = data, None
+        else:
+            self._raw, self._data = None, data
+        self._parsed = None
+
+    @property
+    def data(self):
+        """Raw api dict"""
+        if self._data is None:
+            self._data, self._raw = _loads(self._raw), None
+        return self._data
+
+    def _cached(self, name, func):
+        if self._parsed is None:
+            self._parsed = {}
+        if name not in self._parsed:
+            self._parsed[name] = func()
+        return self._parsed[name]
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        """Get raw value of the api dict"""
+        return self.data.get(key, default)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.get('id') or self.get('name')!r})"
+
+
+class Ticket(_Model):
+    """Ticket summary of the ticket list"""
+
+    __slots__ = ()
+
+    @property
+    def id(self):  # pylint: disable=invalid-name
+        """Ticket id"""
+        return self.data["id"]
+
+    @property
+    def date(self):
+        """Purchase date as timezone aware datetime"""
+        return self._cached("date", lambda: parse_date(self.data["date"]) if self.data.get("date") else None)
+
+    @property
+    def total_amount(self):
+        """Total amount as Decimal"""
+        return self._cached("total_amount", lambda: parse_amount(self.data.get("totalAmount")))
+
+    @property
+    def store(self):
+        """Store dict with id, name and address"""
+        return self.data.get("store") or {}
+
+
+class LineItem(_Model):
+    """Single article line of a receipt"""
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """Article name"""
+        return self.data.get("name")
+
+    @property
+    def code(self):
+        """Article code (EAN)"""
+        return self.data.get("codeInput")
+
+    @property
+    def is_weight(self):
+        """Quantity is a weight"""
+        return bool(self.data.get("isWeight"))
+
+    @property
+    def quantity(self):
+        """Quantity as Decimal"""
+        return self._cached("quantity", lambda: parse_amount(self.data.get("quantity")))
+
+    @property
+    def unit_price(self):
+        """Unit price as Decimal"""
+        return self._cached("unit_price", lambda: parse_amount(self.data.get("currentUnitPrice")))
+
+    @property
+    def amount(self):
+        """Line amount before discounts as Decimal"""
+        return self._cached("amount", lambda: parse_amount(self.data.get("originalAmount")))
+
+    @property
+    def discounts(self):
+        """List of (description, amount) tuples"""
+        return self._cached(
+            "discounts",
+            lambda: [
+                (item.get("description"), parse_amount(item.get("amount"))) for item in self.data.get("discounts") or []
+            ],
+        )
+
+    @property
+    def discount_total(self):
+        """Sum of all discounts as Decimal"""
+        return sum((amount or Decimal(0) for _, amount in self.discounts), Decimal(0))
+
+
+class Receipt(Ticket):
+    """Full receipt with line items"""
+
+    __slots__ = ()
+
+    @property
+    def items(self):
+        """List of line items"""
+        return self._cached("items", lambda: [LineItem(item) for item in self.data.get("itemsLine") or []])
+
+
+class Coupon(_Model):
+    """Coupon of the V2 or promotion of the V1 coupon api"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, response):
+        """Get coupons of all sections of a `coupons()` or `coupon_promotions_v1()` response"""
+        return [
+            cls(coupon)
+            for section in response.get("sections", [])
+            for coupon in section.get("coupons", section.get("promotions", []))
+        ]
+
+    @property
+    def id(self):  # pylint: disable=invalid-name
+        """Coupon id, the promotion id for V1 promotions"""
+        return self.data.get("id") or self.data.get("promotionId")
+
+    @property
+    def title(self):
+        """Coupon title"""
+        return self.data.get("title")
+
+    @property
+    def is_activated(self):
+        """Coupon is activated"""
+        return bool(self.data.get("isActivated"))
+
+    @property
+    def start(self):
+        """Start of validity as timezone aware datetime"""
+        start = self.data.get("startValidityDate") or self.data.get("validity", {}).get("start")
+        return self._cached("start", lambda: parse_date(start) if start else None)
+
+    @property
+    def end(self):
+        """End of validity as timezone aware datetime"""
+        end = self.data.get("endValidityDate") or self.data.get("validity", {}).get("end")
+        return self._cached("end", lambda: parse_date(end) if end else None)
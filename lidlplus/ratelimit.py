@@ -0,0 +1,116 @@
+"""
+Client side rate limiting and backoff
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def retry_after(headers):
+    """Get seconds to wait from a Retry-After header in seconds or http date format, or None"""
+    if not (value := (headers or {}).get("Retry-After")):
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, factor=0.5, maximum=30.0):
+    """Exponential backoff with full jitter for the given retry attempt, starting at 0"""
+    return random.uniform(0, min(maximum, factor * 2**attempt))
+
+
+class TokenBucket:  # pylint: disable=too-many-instance-attributes
+    """
+    Token bucket with an adaptive rate.
+
+    The rate is halved when the server rate limits and grows back step by step with every
+    successful request, so bulk work settles just below the limit of the server.
+    """
+
+    def __init__(self, rate=50.0, burst=50, min_rate=0.5):
+        """
+        :param rate: Maximum requests per second.
+        :param burst: Requests allowed at once before the rate applies.
+        :param min_rate: Lowest rate the bucket slows down to.
+        """
+        self._max_rate = self.rate = rate
+        self._min_rate = min_rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """Take a token and get the seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def slow_down(self, delay=None):
+        """Halve the rate after being rate limited and pause for delay seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self._min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            if delay:
+                self._blocked_until = max(self._blocked_until, now + delay)
+
+    def speed_up(self):
+        """Raise the rate again after a successful request"""
+        with self._lock:
+            if self.rate < self._max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self._max_rate, self.rate + self._max_rate / 20)
+
+
+class RateLimiter:
+    """Adaptive token bucket per host, can be shared by many api connectors"""
+
+    def __init__(self, rate=50.0, burst=50):
+        """
+        :param rate: Maximum requests per second and host.
+        :param burst: Requests per host allowed at once.
+        """
+        self._buckets = defaultdict(lambda: TokenBucket(rate, burst))
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        """Get token bucket of the host of url"""
+        with self._lock:
+            return self._buckets[urlsplit(url).netloc]
+
+    def reserve(self, url):
+        """Get the seconds to wait before sending a request to url"""
+        return self.bucket(url).reserve()
+
+    def wait(self, url):
+        """Block until a request to url may be sent"""
+        if (delay := self.reserve(url)) > 0:
+            time.sleep(delay)
+
+    def slow_down(self, url, delay=None):
+        """Lower the rate of the host of url after being rate limited"""
+        self.bucket(url).slow_down(delay)
+
+    def speed_up(self, url):
+        """Raise the rate of the host of url after a successful request"""
+        self.bucket(url).speed_up()
@@ -0,0 +1,216 @@
+"""
+Local caching http gateway
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from lidlplus.exceptions import ApiError, MissingLogin
+from lidlplus.utils import parse_date
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _BadRequest(Exception):
+    """Invalid query parameters of a gateway request"""
+
+
+class SingleFlightCache:
+    """
+    Time based cache where concurrent loads of the same key share one call.
+
+    The first caller of a missing key runs the loader, callers arriving meanwhile wait for its result
+    instead of loading again. Failures aren't cached.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, ttl):
+        """
+        Get cached value or load it.
+
+        :param loader: Function without arguments returning the value.
+        :param ttl: Seconds to keep the value, 0 only coalesces concurrent calls.
+        """
+        with self._lock:
+            if (entry := self._entries.get(key)) and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            if call := self._calls.get(key):
+                leader = False
+            else:
+                call, leader = Future(), True
+                self._calls[key] = call
+        if not leader:
+            return call.result()
+        try:
+            value = loader()
+        except Exception as exc:
+            with self._lock:
+                del self._calls[key]
+            call.set_exception(exc)
+            raise
+        with self._lock:
+            del self._calls[key]
+            if ttl:
+                self._entries[key] = (time.monotonic() + ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._maxsize:
+                    self._entries.popitem(last=False)
+        call.set_result(value)
+        return value
+
+    def invalidate(self, prefix):
+        """Drop all values with keys starting with prefix"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+# pylint: disable=too-few-public-methods
+class Gateway:
+    """
+    Serve the api of one or many accounts as json endpoints.
+
+    Every account has one `LidlPlusApi`, so all consumers share its token and connection pool.
+    Responses are cached and identical concurrent requests cost one upstream call.
+    """
+
+    ROUTES = [
+        ("GET", r"/accounts", "accounts"),
+        ("GET", r"/(?P<account>[^/]+)/tickets", "tickets"),
+        ("GET", r"/(?P<account>[^/]+)/tickets/(?P<id>[^/]+)", "ticket"),
+        ("GET", r"/(?P<account>[^/]+)/coupons", "coupons"),
+        ("GET", r"/(?P<account>[^/]+)/coupons/v1", "coupons_v1"),
+        ("POST", r"/(?P<account>[^/]+)/coupons/(?P<id>[^/]+)/activation", "activate_coupon"),
+        ("DELETE", r"/(?P<account>[^/]+)/coupons/(?P<id>[^/]+)/activation", "deactivate_coupon"),
+        ("POST", r"/(?P<account>[^/]+)/coupons/v1/(?P<id>[^/]+)/activation", "activate_coupon_v1"),
+        ("GET", r"/(?P<account>[^/]+)/loyalty_id", "loyalty_id"),
+    ]
+
+    def __init__(self, apis, ttl=60, receipt_ttl=24 * 60 * 60, max_workers=4):
+        """
+        :param apis: Dict of account name to `LidlPlusApi`.
+        :param ttl: Seconds ticket lists and coupons are served from cache.
+        :param receipt_ttl: Seconds receipts are served from cache, they don't change once issued.
+        :param max_workers: Parallel page downloads of ticket lists.
+        """
+        self._apis = apis
+        self._ttl = ttl
+        self._receipt_ttl = receipt_ttl
+        self._max_workers = max_workers
+        self._cache = SingleFlightCache()
+
+    def _route(self, method, path):
+        for route_method, pattern, name in self.ROUTES:
+            if route_method == method and (match := re.fullmatch(pattern, path)):
+                return name, {key: unquote(value) for key, value in match.groupdict().items()}
+        return None, {}
+
+    @staticmethod
+    def _dates(query):
+        """Parse since and until of a query, raises `_BadRequest` for invalid dates"""
+        try:
+            return tuple(parse_date(query[key]) if query.get(key) else None for key in ("since", "until"))
+        except ValueError as exc:
+            raise _BadRequest(str(exc)) from exc
+
+    def _load(self, name, api, params, query):
+        # pylint: disable=too-many-return-statements
+        if name == "tickets":
+            since, until = self._dates(query)
+            favorite = query.get("only_favorite", "").lower() in ("1", "true")
+            return api.tickets(favorite, max_workers=self._max_workers, since=since, until=until)
+        if name == "ticket":
+            return api.ticket(params["id"])
+        if name == "coupons":
+            return api.coupons()
+        if name == "coupons_v1":
+            return api.coupon_promotions_v1()
+        if name == "activate_coupon":
+            return api.activate_coupon(params["id"])
+        if name == "deactivate_coupon":
+            return api.deactivate_coupon(params["id"])
+        if name == "activate_coupon_v1":
+            response = api.activate_coupon_promotion_v1(params["id"])
+            return response.json() if response.content else {"status": response.status_code}
+        return api.loyalty_id()
+
+    def handle(self, method, url):  # pylint: disable=too-many-return-statements
+        """
+        Answer a request.
+
+        :return: Tuple of http status and json serializable body.
+        """
+        url = urlsplit(url)
+        name, params = self._route(method, url.path.rstrip("/") or "/")
+        if name is None:
+            return 404, {"error": "Unknown endpoint"}
+        if name == "accounts":
+            return 200, list(self._apis)
+        if (api := self._apis.get(params["account"])) is None:
+            return 404, {"error": f"Unknown account {params['account']}"}
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        key = f"{params['account']}:{method}:{url.path}?{url.query}"
+        ttl = self._receipt_ttl if name == "ticket" else self._ttl if method == "GET" else 0
+        status = 200
+        try:
+            body = self._cache.get(key, lambda: self._load(name, api, params, query), ttl)
+        except ApiError as exc:
+            return exc.status or 502, {"error": str(exc)}
+        except MissingLogin as exc:
+            return 401, {"error": str(exc)}
+        except _BadRequest as exc:
+            return 400, {"error": str(exc)}
+        except ValueError as exc:
+            # the upstream call went through, only its body couldn't be decoded
+            status, body = 502, {"error": f"Invalid upstream response - {exc}"}
+        if method != "GET":
+            # also drops the v1 coupon list, its path starts with the same prefix
+            self._cache.invalidate(f"{params['account']}:GET:/{params['account']}/coupons")
+        return status, body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    gateway = None
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        _LOGGER.debug(format, *args)
+
+    def _respond(self):
+        if length := int(self.headers.get("Content-Length") or 0):
+            self.rfile.read(length)
+        try:
+            status, body = self.gateway.handle(self.command, self.path)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.exception("Failed to handle %s %s", self.command, self.path)
+            status, body = 500, {"error": str(exc)}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_DELETE = _respond
+
+
+def create_server(gateway, host="127.0.0.1", port=8080):
+    """Create a threading http server for a gateway, run it with `serve_forever()`"""
+    handler = type("Handler", (_Handler,), {"gateway": gateway})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
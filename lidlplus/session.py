@@ -0,0 +1,40 @@
+"""
+Pooled http session
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_session(pool_connections=8, pool_maxsize=10, retries=3, backoff_factor=0.5, pool_block=False):
+    """
+    Create a keep-alive session with connection pooling and retries of failed connections.
+
+    Error responses aren't retried by the session, `LidlPlusApi` retries them with backoff and rate limiting.
+    Read errors are only retried for idempotent methods, a POST like a token renewal may already have been
+    processed and is only retried if the connection failed.
+
+    :param pool_connections: Number of hosts to keep a connection pool for.
+    :param pool_maxsize: Maximum number of connections kept alive per host.
+    :param retries: How often a failed connection or read of an idempotent request is retried.
+    :param backoff_factor: Factor for the exponential backoff between retries.
+    :param pool_block: Block instead of opening extra connections when a host pool is exhausted.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status=0,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+        pool_block=pool_block,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,176 @@
+"""
+Spending statistics over stored receipts
+"""
+
+import json
+from collections import defaultdict
+from functools import lru_cache
+
+from lidlplus.archive import MAGIC, ReceiptArchive
+from lidlplus.models import parse_amount
+
+
+@lru_cache(maxsize=65536)
+def _amount(value):
+    return float(parse_amount(value) or 0)
+
+
+def load_receipts(path, country=None):
+    """
+    Load receipts from a receipt store, a receipt archive, a json list or a ndjson file.
+
+    :param country: Only load receipts of this country from a receipt store, e.g. "DE" or "de".
+    """
+    with open(path, "rb") as file:
+        header = file.read(16)
+    if header.startswith(MAGIC):
+        with ReceiptArchive(path) as archive:
+            return list(archive.receipts())
+    if header.startswith(b"SQLite format 3"):
+        # pylint: disable=import-outside-toplevel
+        from lidlplus.store import ReceiptStore
+
+        with ReceiptStore(path) as store:
+            # the store keys receipts by the upper case country of the api
+            return store.receipts(country.upper() if country else None)
+    with open(path, encoding="utf-8") as file:
+        if header.lstrip().startswith(b"["):
+            return json.load(file)
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _columns(receipts):  # pylint: disable=too-many-locals
+    """
+    Flatten receipts into item and receipt columns.
+
+    Items refer to their receipt by index, dates are kept as iso strings which sort chronologically.
+    """
+    visits = {"date": [], "month": [], "store": []}
+    columns = {name: [] for name in ("receipt", "article", "quantity", "price", "spend", "discount")}
+    add_date, add_month, add_store = (column.append for column in visits.values())
+    add_article, add_quantity, add_price, add_spend, add_discount = (
+        columns[name].append for name in ("article", "quantity", "price", "spend", "discount")
+    )
+    add_receipts = columns["receipt"].extend
+    for index, receipt in enumerate(receipts):
+        date = receipt.get("date") or ""
+        add_date(date)
+        add_month(date[:7])
+        add_store((receipt.get("store") or {}).get("name") or "")
+        items = receipt.get("itemsLine") or ()
+        add_receipts([index] * len(items))
+        for item in items:
+            discounts = item.get("discounts")
+            discount = sum(_amount(discount.get("amount")) for discount in discounts) if discounts else 0.0
+            add_article(item.get("name") or "")
+            add_quantity(_amount(item.get("quantity")))
+            add_price(_amount(item.get("currentUnitPrice")))
+            add_spend(_amount(item.get("originalAmount")) - discount)
+            add_discount(discount)
+    return columns, visits
+
+
+def _top(articles, top):
+    """Round article totals and keep the top articles by spending"""
+    return dict(sorted(_rounded(articles).items(), key=lambda entry: -entry[1]["total"])[:top])
+
+
+def _aggregate_python(columns, visits, top):  # pylint: disable=too-many-locals
+    spend, savings = [0.0] * len(visits["date"]), [0.0] * len(visits["date"])
+    articles = defaultdict(lambda: {"quantity": 0.0, "total": 0.0, "savings": 0.0})
+    rows = zip(columns["receipt"], columns["article"], columns["quantity"], columns["spend"], columns["discount"])
+    for receipt, article, quantity, item_spend, discount in rows:
+        spend[receipt] += item_spend
+        savings[receipt] += discount
+        entry = articles[article]
+        entry["quantity"] += quantity
+        entry["total"] += item_spend
+        entry["savings"] += discount
+    months = defaultdict(lambda: {"total": 0.0, "savings": 0.0, "receipts": 0})
+    stores = defaultdict(lambda: {"total": 0.0, "savings": 0.0, "receipts": 0})
+    for month, store, receipt_spend, receipt_savings in zip(visits["month"], visits["store"], spend, savings):
+        for entry in (months[month], stores[store]):
+            entry["total"] += receipt_spend
+            entry["savings"] += receipt_savings
+            entry["receipts"] += 1
+    articles = _top(articles, top)
+    prices = defaultdict(list)
+    dates = visits["date"]
+    for receipt, article, price in zip(columns["receipt"], columns["article"], columns["price"]):
+        if article in articles:
+            prices[article].append((dates[receipt], price))
+    history = {}
+    for article, entries in prices.items():
+        entries.sort()
+        history[article] = changes = []
+        for date, price in entries:
+            if not changes or changes[-1][1] != price:
+                changes.append([date[:10], price])
+    return dict(months), dict(stores), articles, history
+
+
+def _aggregate_pandas(columns, visits, top):  # pylint: disable=too-many-locals
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import pandas as pd
+
+    frame = pd.DataFrame(columns)
+    receipts = frame.groupby("receipt")[["spend", "discount"]].sum().reindex(range(len(visits["date"])), fill_value=0)
+    visit_frame = pd.DataFrame(visits).assign(
+        spend=receipts["spend"].to_numpy(), discount=receipts["discount"].to_numpy()
+    )
+
+    def grouped(data, key, **fields):
+        return data.groupby(key, sort=False).agg(**fields).to_dict("index")
+
+    totals = {"total": ("spend", "sum"), "savings": ("discount", "sum")}
+    months = grouped(visit_frame, "month", **totals, receipts=("spend", "size"))
+    stores = grouped(visit_frame, "store", **totals, receipts=("spend", "size"))
+    articles = _top(grouped(frame, "article", quantity=("quantity", "sum"), **totals), top)
+    prices = frame.loc[frame["article"].isin(list(articles)), ["receipt", "article", "price"]]
+    prices = prices.assign(date=visit_frame["date"].to_numpy()[prices["receipt"].to_numpy()])
+    prices = prices.sort_values(["article", "date", "price"], kind="stable")
+    names, values = prices["article"].to_numpy(), prices["price"].to_numpy()
+    first = np.r_[True, names[1:] != names[:-1]]
+    prices = prices.loc[first | np.r_[True, values[1:] != values[:-1]]]
+    names, dates, values = (
+        prices["article"].to_numpy(),
+        prices["date"].str.slice(0, 10).tolist(),
+        prices["price"].tolist(),
+    )
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]]).tolist()
+    history = {
+        names[start]: [list(change) for change in zip(dates[start:end], values[start:end])]
+        for start, end in zip(starts, [*starts[1:], len(dates)])
+    }
+    return months, stores, articles, history
+
+
+def _rounded(entries):
+    return {name: {key: round(value, 2) for key, value in entry.items()} for name, entry in entries.items()}
+
+
+def spending_stats(receipts, top=None, vectorized=False):
+    """
+    Aggregate spending of receipts.
+
+    :param receipts: Iterable of full receipt dicts.
+    :param top: Only report the articles with the highest spending.
+    :param vectorized: Aggregate with pandas. Flattening the receipts dominates and building the frames
+        costs more than the plain python aggregation saves, so it's off by default.
+    :return: Dict with totals, savings from discounts and coupons, per month, per store and per article
+        spending and the price history of each article.
+    """
+    columns, visits = _columns(receipts)
+    aggregate = _aggregate_pandas if vectorized and columns["receipt"] else _aggregate_python
+    months, stores, articles, history = aggregate(columns, visits, top)
+    return {
+        "receipts": len(visits["date"]),
+        "items": len(columns["receipt"]),
+        "total": round(sum(columns["spend"]), 2),
+        "savings": round(sum(columns["discount"]), 2),
+        "months": dict(sorted(_rounded(months).items())),
+        "stores": _rounded(stores),
+        "articles": articles,
+        "price_history": {article: history[article] for article in articles if article in history},
+    }
@@ -0,0 +1,71 @@
+"""
+Local receipt store
+"""
+
+import json
+import sqlite3
+
+
+class ReceiptStore:
+    """
+    Persistent sqlite receipt cache.
+
+    Receipts are immutable once issued, so they are keyed by country and ticket id and never refreshed.
+    The summary from the ticket list is stored first, the full receipt is added as soon as it was fetched.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tickets ("
+            "country TEXT NOT NULL, id TEXT NOT NULL, date TEXT, summary TEXT NOT NULL, data TEXT, "
+            "PRIMARY KEY (country, id))"
+        )
+        self._connection.commit()
+
+    def close(self):
+        """Close database connection"""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def contains(self, country, ticket_id):
+        """Check if a ticket is known"""
+        query = "SELECT 1 FROM tickets WHERE country = ? AND id = ?"
+        return self._connection.execute(query, (country, ticket_id)).fetchone() is not None
+
+    def add_summaries(self, country, tickets):
+        """Store ticket list entries, already known tickets are kept untouched"""
+        rows = [(country, ticket["id"], ticket.get("date"), json.dumps(ticket)) for ticket in tickets]
+        with self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO tickets VALUES (?, ?, ?, ?, NULL)", rows)
+
+    def add_receipt(self, country, ticket_id, receipt):
+        """Store full receipt data of a known ticket"""
+        with self._connection:
+            query = "UPDATE tickets SET data = ? WHERE country = ? AND id = ?"
+            self._connection.execute(query, (json.dumps(receipt), country, ticket_id))
+
+    def missing(self, country):
+        """Ids of tickets without full receipt data"""
+        query = "SELECT id FROM tickets WHERE country = ? AND data IS NULL ORDER BY date DESC"
+        return [row[0] for row in self._connection.execute(query, (country,))]
+
+    def receipt(self, country, ticket_id):
+        """Get full receipt data by ticket id"""
+        query = "SELECT data FROM tickets WHERE country = ? AND id = ?"
+        if (row := self._connection.execute(query, (country, ticket_id)).fetchone()) and row[0]:
+            return json.loads(row[0])
+        return None
+
+    def receipts(self, country=None):
+        """Get all full receipts, newest first, of one or all countries"""
+        if country is None:
+            query = "SELECT data FROM tickets WHERE data IS NOT NULL ORDER BY date DESC"
+            return [json.loads(row[0]) for row in self._connection.execute(query)]
+        query = "SELECT data FROM tickets WHERE country = ? AND data IS NOT NULL ORDER BY date DESC"
+        return [json.loads(row[0]) for row in self._connection.execute(query, (country,))]
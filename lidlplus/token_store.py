@@ -0,0 +1,104 @@
+"""
+Token persistence
+"""
+
+import json
+import os
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+
+from lidlplus.utils import file_lock
+
+
+class TokenStore:
+    """
+    Base class for token stores.
+
+    A store keeps the access token, its expiry and the rotated refresh token of one account,
+    so new processes can reuse a still valid token instead of renewing it.
+    """
+
+    def load(self):
+        """Load token data dict or None if nothing is stored"""
+        raise NotImplementedError
+
+    def save(self, data):
+        """Persist token data dict"""
+        raise NotImplementedError
+
+    def lock(self):
+        """
+        Context manager held while a token is renewed.
+
+        Refresh tokens are rotated, so only one user of a store may renew at a time. Stores shared between
+        processes have to lock across processes, the default doesn't lock at all.
+        """
+        return nullcontext()
+
+
+class MemoryTokenStore(TokenStore):
+    """Keep token data in memory, e.g. to share it between instances of one process"""
+
+    def __init__(self):
+        self._data = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        return self._data
+
+    def save(self, data):
+        self._data = dict(data)
+
+    def lock(self):
+        return self._lock
+
+
+class FileTokenStore(TokenStore):
+    """
+    Keep token data in a json file only readable by the current user.
+
+    Renewals are serialized with a lock file next to it, so processes sharing the file don't renew with
+    the same refresh token.
+    """
+
+    def __init__(self, path):
+        self._path = Path(path)
+
+    def load(self):
+        try:
+            return json.loads(self._path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, data):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+        with os.fdopen(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp, self._path)
+
+    def lock(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        return file_lock(self._path.with_name(f"{self._path.name}.lock"))
+
+
+class KeyringTokenStore(TokenStore):
+    """Keep token data in the system keyring, needs the keyring package"""
+
+    def __init__(self, username, service="lidl-plus"):
+        # keyring is optional and only needed by this store
+        # pylint: disable=import-outside-toplevel, import-error
+        import keyring
+
+        self._keyring = keyring
+        self._username = username
+        self._service = service
+
+    def load(self):
+        if data := self._keyring.get_password(self._service, self._username):
+            return json.loads(data)
+        return None
+
+    def save(self, data):
+        self._keyring.set_password(self._service, self._username, json.dumps(data))
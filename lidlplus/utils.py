@@ -0,0 +1,76 @@
+"""
+Helper functions
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def parse_date(value):
+    """Parse iso date of api responses as timezone aware datetime, naive dates are treated as UTC"""
+    date = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def date_range(since=None, until=None):
+    """Treat naive dates of a date range as UTC"""
+    return tuple(date.replace(tzinfo=timezone.utc) if date and not date.tzinfo else date for date in (since, until))
+
+
+def in_date_range(item, since, until):
+    """Ticket is issued in the date range, tickets without date always are"""
+    if not (since or until) or not item.get("date"):
+        return True
+    date = parse_date(item["date"])
+    return (not since or date >= since) and (not until or date <= until)
+
+
+def page_count(page):
+    """Exact number of pages of a ticket list by the total count and the page size the server used"""
+    if not page.get("size") or not page.get("totalCount"):
+        return 1
+    return -(-page["totalCount"] // page["size"])
+
+
+def page_passed(page, since):
+    """Page of a ticket list reaches back beyond since, so later pages only contain older tickets"""
+    return bool(since) and any(item.get("date") and parse_date(item["date"]) < since for item in page["tickets"])
+
+
+def api_headers(token, language, operating_system):
+    """Headers of requests to the Lidl Plus apis"""
+    return {
+        "Authorization": f"Bearer {token}",
+        "App-Version": "999.99.9",
+        "Operating-System": operating_system,
+        "App": "com.lidl.eci.lidl.plus",
+        "Accept-Language": language,
+    }
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a lock file, blocks until other processes released it"""
+    with open(path, "a+b") as file:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
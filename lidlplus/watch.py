@@ -0,0 +1,173 @@
+"""
+Watch for new receipts and coupons
+"""
+
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+import requests
+
+from lidlplus.models import Coupon
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _SeenIds:
+    """Insertion ordered set forgetting the oldest ids above maxsize"""
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, key):
+        """Remember id, a known id is refreshed"""
+        self._ids[key] = None
+        self._ids.move_to_end(key)
+        while len(self._ids) > self._maxsize:
+            self._ids.popitem(last=False)
+
+
+def ndjson_emitter(file=None):
+    """Get emitter writing every event as json line to file, defaults to stdout"""
+
+    def emit(event):
+        out = file or sys.stdout
+        out.write(json.dumps(event) + "\n")
+        out.flush()
+
+    return emit
+
+
+def webhook_emitter(url, session=None, timeout=10):
+    """Get emitter posting every event as json to url"""
+    session = session or requests.Session()
+
+    def emit(event):
+        session.post(url, json=event, timeout=timeout).raise_for_status()
+
+    return emit
+
+
+# pylint: disable=too-many-instance-attributes
+class Watcher:
+    """
+    Poll an authenticated `LidlPlusApi` for new receipts and coupons.
+
+    The first page of the ticket list and both coupon lists are polled. The interval doubles after every poll
+    without news up to max_interval and drops back to interval once something new shows up. Coupon lists
+    are fetched through the response cache of the api, so polling faster than its ttl only revalidates.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        api,
+        emit=None,
+        interval=60,
+        max_interval=30 * 60,
+        *,
+        receipts=True,
+        coupons=True,
+        full_receipts=True,
+        max_seen=10000,
+    ):
+        """
+        :param api: Authenticated `LidlPlusApi`.
+        :param emit: Callable receiving every event dict, defaults to NDJSON on stdout.
+        :param interval: Seconds between polls while there is news.
+        :param max_interval: Longest pause between polls while nothing changes.
+        :param full_receipts: Emit full receipts instead of the ticket list entries.
+        :param max_seen: Number of remembered ids per kind, bounds memory for long uptimes.
+        """
+        self._api = api
+        self._emit = emit or ndjson_emitter()
+        self._min_interval = self.interval = interval
+        self._max_interval = max_interval
+        self._receipts = receipts
+        self._coupons = coupons
+        self._full_receipts = full_receipts
+        self._seen = {"receipt": _SeenIds(max_seen), "coupon": _SeenIds(max_seen)}
+        self._stop = threading.Event()
+        self._initialized = set()
+        self._kinds = {kind for kind, enabled in (("receipt", receipts), ("coupon", coupons)) if enabled}
+
+    def _new_receipts(self):
+        new = []
+        for ticket in self._api.iter_tickets(prefetch=False, max_pages=1):
+            if ticket["id"] in self._seen["receipt"]:
+                break
+            new.append(ticket)
+        events = []
+        for ticket in reversed(new):
+            if "receipt" in self._initialized:
+                try:
+                    data = self._api.ticket(ticket["id"]) if self._full_receipts else ticket
+                except Exception as exc:  # pylint: disable=broad-except
+                    _LOGGER.warning("Failed to fetch receipt %s, retrying next poll - %s", ticket["id"], exc)
+                    break
+                events.append({"type": "receipt", "id": ticket["id"], "data": data})
+            self._seen["receipt"].add(ticket["id"])
+        self._initialized.add("receipt")
+        return events
+
+    def _new_coupons(self):
+        lists = [("v2", self._api.coupons()), ("v1", self._api.coupon_promotions_v1())]
+        events = []
+        for api, response in lists:
+            for coupon in Coupon.from_response(response):
+                key = f"{api}:{coupon.id}"
+                if key in self._seen["coupon"]:
+                    continue
+                self._seen["coupon"].add(key)
+                if "coupon" in self._initialized:
+                    events.append({"type": "coupon", "api": api, "id": coupon.id, "data": coupon.data})
+        self._initialized.add("coupon")
+        return events
+
+    def _publish(self, events):
+        for event in events:
+            try:
+                self._emit(event)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning("Failed to emit %s %s - %s", event["type"], event["id"], exc)
+        return events
+
+    def poll(self):
+        """
+        Poll once and emit news.
+
+        The first poll only records the current state. Receipt events are emitted before the coupons are
+        fetched, so a failing coupon list doesn't swallow them.
+
+        :return: List of emitted events.
+        """
+        events = self._publish(self._new_receipts()) if self._receipts else []
+        return events + (self._publish(self._new_coupons()) if self._coupons else [])
+
+    def run(self, max_polls=None):
+        """Poll until `stop()` is called, backing off while nothing changes or the api fails"""
+        polls = 0
+        while not self._stop.is_set() and (max_polls is None or polls < max_polls):
+            baseline = not self._kinds <= self._initialized
+            try:
+                news = self.poll()
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning("Poll failed - %s", exc)
+                news, baseline = [], False
+            polls += 1
+            self.interval = self._min_interval if news or baseline else min(self._max_interval, self.interval * 2)
+            if max_polls is None or polls < max_polls:
+                self._stop.wait(self.interval)
+
+    def stop(self):
+        """Stop `run()` after the current poll"""
+        self._stop.set()
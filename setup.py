@@ -47,7 +47,19 @@ setup(
             "oic>=1.4.0",
             "selenium-wire>=5.1.0",
             "webdriver-manager>=3.8.5",
-        ]
+        ],
+        "async": [
+            "aiohttp>=3.8",
+        ],
+        "parquet": [
+            "pyarrow>=10.0",
+        ],
+        "stats": [
+            "pandas>=1.5",
+        ],
+        "archive": [
+            "zstandard>=0.19",
+        ],
     },
     entry_points={
         "console_scripts": [
@@ -0,0 +1,82 @@
+"""
+Tests of the receipt archive recovery
+"""
+
+import os
+
+import pytest
+
+from lidlplus.archive import _RECORD, ReceiptArchive
+
+
+def _receipt(number):
+    return {"id": f"T{number}", "date": f"2024-01-{number:02d}T10:00:00+00:00", "itemsLine": [{"name": "Milk"}]}
+
+
+@pytest.fixture(name="path")
+def fixture_path(tmp_path):
+    path = tmp_path / "receipts.lpa"
+    with ReceiptArchive(path, "a", codec="zlib") as archive:
+        archive.extend(_receipt(number) for number in range(1, 4))
+    return path
+
+
+def _index(path):
+    return (path.parent / f"{path.name}.idx").read_text(encoding="utf-8").splitlines()
+
+
+def test_missing_index_is_rebuilt(path):
+    index = _index(path)
+    os.remove(f"{path}.idx")
+    with ReceiptArchive(path) as archive:
+        assert [receipt["id"] for receipt in archive] == ["T1", "T2", "T3"]
+    assert not os.path.exists(f"{path}.idx")
+    with ReceiptArchive(path, "a") as archive:
+        assert archive.get("T2") == _receipt(2)
+    assert _index(path) == index
+
+
+def test_index_behind_is_completed(path):
+    index = _index(path)
+    (path.parent / f"{path.name}.idx").write_text(index[0] + "\n" + index[1][:5], encoding="utf-8")
+    with ReceiptArchive(path) as archive:
+        assert archive.ids() == ["T1", "T2", "T3"]
+    with ReceiptArchive(path, "a"):
+        pass
+    assert _index(path) == index
+
+
+def test_partial_record_is_ignored_by_readers(path):
+    size = path.stat().st_size
+    with open(path, "ab") as file:
+        file.write(_RECORD.pack(100, 2) + b"T9")
+    with ReceiptArchive(path) as archive:
+        assert len(archive) == 3
+        assert archive.get("T3") == _receipt(3)
+    assert path.stat().st_size == size + _RECORD.size + 2
+
+
+def test_partial_record_is_cut_off_by_writers(path):
+    size = path.stat().st_size
+    with open(path, "ab") as file:
+        file.write(_RECORD.pack(100, 2) + b"T9")
+    with ReceiptArchive(path, "a") as archive:
+        assert path.stat().st_size == size
+        assert archive.extend([_receipt(4), _receipt(1)]) == ["T4"]
+    with ReceiptArchive(path) as archive:
+        assert [receipt["id"] for receipt in archive.receipts()] == ["T4", "T3", "T2", "T1"]
+
+
+def test_writers_pick_up_records_of_each_other(path):
+    with ReceiptArchive(path, "a") as first, ReceiptArchive(path, "a") as second:
+        assert first.extend([_receipt(4)]) == ["T4"]
+        assert second.extend([_receipt(4), _receipt(5)]) == ["T5"]
+        assert second.get("T4") == _receipt(4)
+    with ReceiptArchive(path) as archive:
+        assert archive.ids() == ["T1", "T2", "T3", "T4", "T5"]
+    assert len(_index(path)) == 5
+
+
+def test_readers_cannot_append(path):
+    with ReceiptArchive(path) as archive, pytest.raises(ValueError):
+        archive.extend([_receipt(4)])